@@ -1,8 +1,89 @@
 __version__ = "0.3.2"
 
-from .auth import OAuth2
-try:
-    from .auth import ClientLoginAuth
-except ImportError:
-    pass
-from .client import delete_job, get_job, list_jobs, list_printers, submit_job
+import sys
+
+# name -> module it's defined in, imported when the name is first used (on
+# Python 3.7+), so ``python -m cloudprinting`` only imports what it needs
+_exports = {
+    "OAuth2": "auth",
+    "ClientLoginAuth": "auth",
+    "DocumentCache": "cache",
+    "JobCache": "cache",
+    "JobChangeFeed": "changes",
+    "CloudPrintClient": "client",
+    "delete_job": "client",
+    "delete_jobs": "client",
+    "get_job": "client",
+    "get_printer": "client",
+    "iter_jobs": "client",
+    "iter_printers": "client",
+    "job_filter": "client",
+    "list_jobs": "client",
+    "list_printers": "client",
+    "submit_job": "client",
+    "submit_jobs": "client",
+    "PrinterDirectory": "directory",
+    "Instrumentation": "instrument",
+    "LoggingInstrumentation": "instrument",
+    "MetricsRegistry": "instrument",
+    "AccountPool": "pool",
+    "Job": "records",
+    "Printer": "records",
+    "RetryPolicy": "retry",
+    "RateLimiter": "scheduler",
+    "Scheduler": "scheduler",
+    "TokenBucket": "scheduler",
+    "Spooler": "spool",
+    "FileTokenStore": "tokens",
+    "MemoryTokenStore": "tokens",
+    "TokenStore": "tokens",
+    "JobWatcher": "watcher",
+    "AsyncCloudPrintClient": "aio",
+}
+# names whose modules need optional dependencies (or a newer Python)
+_optional = frozenset(["AsyncCloudPrintClient", "ClientLoginAuth"])
+
+
+def _load(name):
+    """
+    Import *name*, or raise `AttributeError` if its optional dependencies
+    aren't available.
+    """
+    try:
+        module = __import__(_exports[name], globals(), fromlist=[name],
+                            level=1)
+        value = getattr(module, name)
+    except (ImportError, SyntaxError, AttributeError):
+        if name not in _optional:
+            raise
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name == "__all__":
+            names = []
+            for export in _exports:
+                try:
+                    _load(export)
+                except AttributeError:
+                    continue
+                names.append(export)
+            globals()["__all__"] = names
+            return names
+        if name in _exports:
+            return _load(name)
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()) | set(_exports))
+else:
+    for _name in _exports:
+        try:
+            _load(_name)
+        except AttributeError:
+            pass
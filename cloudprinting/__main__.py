@@ -1,174 +1,775 @@
 # coding: utf-8
-from . import client
-from .auth import OAuth2
-from argparse import ArgumentParser, FileType
+"""
+The command line interface, see ``python -m cloudprinting --help``.
+
+Only the standard library is imported until a command needs the API, and if a
+daemon (``python -m cloudprinting daemon``) is listening on the socket, calls
+are forwarded to it, so they reuse its connections and tokens.
+"""
+from __future__ import print_function
+from argparse import ArgumentParser
+from collections import OrderedDict
+import errno
+from glob import glob
+import json
+import os
+from os.path import expanduser, isabs, join, relpath
 from pprint import pprint
-import requests
+import socket
 import sys
+import threading
+from .compat import text_type
 
+try:
+    input = raw_input
+except NameError:
+    pass
 
-def do_authorise(args):
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+DEFAULT_SOCKET = join(expanduser("~"), ".cloudprinting.sock")
+
+#: commands that may be forwarded to a daemon
+FORWARDED = frozenset(["print", "print-batch", "list-printers", "list-jobs",
+                       "get-job", "delete-job"])
+
+#: columns written by ``--format tsv``
+JOB_COLUMNS = ("id", "status", "printerid", "title", "ownerId", "createTime",
+               "updateTime")
+PRINTER_COLUMNS = ("id", "name", "displayName", "connectionStatus", "type",
+                   "proxy")
+RESULT_COLUMNS = ("success", "message")
+BATCH_COLUMNS = ("path", "printer", "ok", "job", "error", "elapsed")
+
+
+class Context(object):
+    """
+    What commands use to reach the API, and where they write their output.
+
+    In a daemon, one context is shared by every call, so its client's
+    connections and its `OAuth2` instances are reused. Only the
+    *max_auths* most recently used access tokens are kept.
+    """
+    max_auths = 32
+
+    def __init__(self, out=None, err=None, auth=None, pool_maxsize=10):
+        self.out = out or sys.stdout
+        self.err = err or sys.stderr
+        self.default_auth = auth
+        self.pool_maxsize = pool_maxsize
+        self._client = None
+        self._auths = OrderedDict()  # (access token, type) -> OAuth2
+        self._auths_lock = threading.Lock()
+
+    def writing_to(self, out, err):
+        """
+        Returns a context sharing this one's client and tokens, that writes
+        to *out* and *err*.
+        """
+        context = Context(out=out, err=err, auth=self.default_auth)
+        context._client = self.client
+        context._auths = self._auths
+        context._auths_lock = self._auths_lock
+        return context
+
+    @property
+    def client(self):
+        if self._client is None:
+            from .client import CloudPrintClient
+            self._client = CloudPrintClient(pool_maxsize=self.pool_maxsize)
+        return self._client
+
+    def auth(self, args):
+        """
+        Returns the `OAuth2` for the access token given on the command line,
+        or the daemon's own.
+        """
+        if not args.access_token:
+            if self.default_auth is None:
+                raise SystemExit("--access-token is required")
+            return self.default_auth
+        from .auth import OAuth2
+        key = (args.access_token, args.token_type)
+        with self._auths_lock:
+            auth = self._auths.pop(key, None)
+            if auth is None:
+                auth = OAuth2(access_token=args.access_token,
+                              token_type=args.token_type)
+            self._auths[key] = auth
+            while len(self._auths) > self.max_auths:
+                self._auths.popitem(last=False)
+        return auth
+
+
+class RecordWriter(object):
+    """
+    Writes records to *out* one at a time, as they're produced.
+
+    :param  format: ``"text"`` (pretty printed), ``"json"`` (an array),
+                    ``"jsonl"`` (an object per line) or ``"tsv"`` (a header,
+                    then tab separated *columns*)
+    :param columns: keys written by ``"tsv"``, defaults to the keys of the
+                    first record
+    """
+    def __init__(self, format, out, columns=None):
+        self.format = format
+        self.out = out
+        self.columns = columns
+        self.count = 0
+
+    def write(self, record):
+        out = self.out
+        if self.format == "json":
+            out.write(",\n" if self.count else "[\n")
+            out.write(json.dumps(record, sort_keys=True))
+        elif self.format == "jsonl":
+            out.write(json.dumps(record, sort_keys=True) + "\n")
+        elif self.format == "tsv":
+            if self.columns is None:
+                self.columns = sorted(record)
+            if not self.count:
+                out.write("\t".join(self.columns) + "\n")
+            out.write("\t".join(tsv_value(record.get(column))
+                                for column in self.columns) + "\n")
+        else:
+            pprint(record, stream=out)
+        self.count += 1
+
+    def close(self):
+        if self.format == "json":
+            self.out.write("\n]\n" if self.count else "[]\n")
+
+
+def tsv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list, bool)):
+        value = json.dumps(value, sort_keys=True)
+    return text_type(value).replace("\\", "\\\\").replace(
+        "\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def write_one(args, context, record, columns=None):
+    """
+    Write a single *record*, as an object rather than an array with
+    ``--format json``.
+    """
+    if args.format == "json":
+        context.out.write(json.dumps(record, sort_keys=True) + "\n")
+    else:
+        RecordWriter(args.format, context.out, columns).write(record)
+
+
+def write_all(args, context, records, columns):
+    """
+    Write *records* as they're produced.
+
+    :returns: the exit status
+    """
+    import requests
+    writer = RecordWriter(args.format, context.out, columns)
+    try:
+        for record in records:
+            writer.write(record)
+    except requests.HTTPError as e:
+        return failure(e.response, context)
+    finally:
+        writer.close()
+    return 0
+
+
+def failure(r, context):
+    """
+    Report an HTTP response for a failed call.
+
+    :returns: the exit status
+    """
+    err = context.err
+    print("Something went wrong:", file=err)
+    print(file=err)
+    print(r.text if r is not None else "(no response)", file=err)
+    return 1
+
+
+def do_authorise(args, context):
     """
     Provide a CLI interface to OAuth2 authorise an app for Google Cloud Print.
     """
+    from .auth import OAuth2
+    # keep stdout for the tokens, unless they're written as text
+    out = context.out if args.format == "text" else context.err
     flow = OAuth2.authorise_device(args.client_id, args.client_secret)
-    (url, code) = flow.next()
-    print "Browse to *URL* and enter *code*:"
-    print
-    print "   URL:", url
-    print "  code:", code
-    print
-
-    while raw_input("Authorisation complete? [y/N] ") != "y":
+    (url, code) = next(flow)
+    print("Browse to *URL* and enter *code*:", file=out)
+    print(file=out)
+    print("   URL:", url, file=out)
+    print("  code:", code, file=out)
+    print(file=out)
+
+    while input("Authorisation complete? [y/N] ") != "y":
         continue
 
-    print "Retrieving OAuth2 tokens..."
-    tokens = flow.next()
+    print("Retrieving OAuth2 tokens...", file=out)
+    tokens = next(flow)
 
-    print
-    print "Tokens:"
-    pprint(tokens, indent=2)
-    print
+    if args.format != "text":
+        write_one(args, context, tokens)
+        return 0
+    print(file=out)
+    print("Tokens:", file=out)
+    pprint(tokens, stream=out, indent=2)
+    print(file=out)
+    return 0
 
 
-def do_refresh(args):
+def do_refresh(args, context):
+    from .auth import OAuth2
+    out = context.out
     oauth2 = OAuth2(access_token=None,
                     token_type=None,
                     refresh_token=args.refresh_token,
                     client_id=args.client_id,
                     client_secret=args.client_secret)
     oauth2.refresh()
-    print "Tokens:"
-    print
-    print '  token_type:', oauth2.token_type
-    print '  access_token:', oauth2.access_token
-    print
-
-
-def do_print(args):
-    oauth2 = OAuth2(access_token=args.access_token,
-                    token_type=args.token_type)
-    r = client.submit_job(args.printer_id, args.path,
-                          tags=args.tags.split(','), auth=oauth2)
-    sys.exit(not diagnose(r, args.verbose))
-
-
-def do_list_printers(args):
-    oauth2 = OAuth2(access_token=args.access_token,
-                    token_type=args.token_type)
-    r = client.list_printers(auth=oauth2)
-    sys.exit(not diagnose(r, True))
+    if args.format != "text":
+        write_one(args, context, {"token_type": oauth2.token_type,
+                                  "access_token": oauth2.access_token,
+                                  "expires_at": oauth2.expires_at})
+        return 0
+    print("Tokens:", file=out)
+    print(file=out)
+    print('  token_type:', oauth2.token_type, file=out)
+    print('  access_token:', oauth2.access_token, file=out)
+    print(file=out)
+    return 0
+
+
+def do_print(args, context):
+    r = context.client.submit_job(args.printer_id, join(args.cwd, args.path),
+                                  tags=args.tags.split(','),
+                                  auth=context.auth(args))
+    if args.format == "text":
+        return int(not diagnose(r, args.verbose, context))
+    if hasattr(r, 'status_code'):
+        return failure(r, context)
+    write_one(args, context, r.get('job') or r, JOB_COLUMNS)
+    return int(not r.get('success', True))
+
+
+def do_print_batch(args, context):
+    """
+    Submit many documents in parallel, writing the outcome of each as it
+    finishes.
+    """
+    from .batch import Batch
+    client = context.client
+    auth = context.auth(args)
+    tags = [tag for tag in args.tags.split(',') if tag]
+
+    def submit(item):
+        path, printer, spec = item
+        if isinstance(spec, Exception):
+            raise spec
+        return client.submit_job(auth=auth, **spec)
+
+    items = batch_items(args.paths or ["-"], args, tags)
+    batch = Batch(submit, items, max_workers=args.concurrency,
+                  key=lambda item: item[1],
+                  per_key_limit=args.per_printer_limit)
+    writer = RecordWriter(args.format, context.out, BATCH_COLUMNS)
+    for outcome in batch:
+        path, printer, _ = outcome.item
+        result = {"path": path, "printer": printer, "ok": outcome.ok,
+                  "job": None, "error": None,
+                  "elapsed": round(outcome.elapsed, 3)}
+        if outcome.error is not None:
+            result['error'] = "%s: %s" % (type(outcome.error).__name__,
+                                          outcome.error)
+        elif hasattr(outcome.result, 'status_code'):
+            result['error'] = "HTTP %d" % outcome.result.status_code
+        else:
+            result['job'] = (outcome.result.get('job') or {}).get('id')
+            if not outcome.ok:
+                result['error'] = outcome.result.get('message')
+        writer.write(result)
+    writer.close()
+    return int(batch.failed > 0)
+
+
+def batch_items(sources, args, tags):
+    """
+    Yields ``(path, printer, spec)`` for each document in *sources*: paths,
+    glob patterns, or ``-`` to read a JSON lines manifest from stdin. *spec*
+    is the `submit_job` arguments, or an exception if they're invalid.
+    """
+    for source in sources:
+        if source == "-":
+            for line in args.stdin:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    path = entry['path']
+                except (ValueError, KeyError, TypeError) as e:
+                    yield (line.strip(), None,
+                           ValueError("invalid manifest line: %s" % e))
+                    continue
+                printer = entry.get('printer') or args.printer_id
+                yield (path, printer, batch_spec(
+                    args, path, printer, entry.get('title'),
+                    entry.get('tags') or tags, entry.get('capabilities')))
+            continue
+        paths = sorted(glob(join(args.cwd, source)))
+        if not paths:
+            yield (source, args.printer_id,
+                   ValueError("no files match %r" % source))
+        for path in paths:
+            if not isabs(source):
+                path = relpath(path, args.cwd)
+            yield (path, args.printer_id,
+                   batch_spec(args, path, args.printer_id, None, tags, None))
+
+
+def batch_spec(args, path, printer, title, tags, capabilities):
+    if not printer:
+        return ValueError("no printer given for %r" % path)
+    return {"printer": printer, "content": join(args.cwd, path),
+            "title": title, "tags": tags, "capabilities": capabilities}
+
+
+def do_list_printers(args, context):
+    printers = context.client.iter_printers(auth=context.auth(args))
+    return write_all(args, context, printers, PRINTER_COLUMNS)
+
+
+def do_list_jobs(args, context):
+    jobs = context.client.iter_jobs(printer=args.printer_id,
+                                    status=args.status,
+                                    page_size=args.page_size,
+                                    auth=context.auth(args))
+    return write_all(args, context, jobs, JOB_COLUMNS)
+
+
+def do_get_job(args, context):
+    job = context.client.get_job(args.id, printer=args.printer_id,
+                                 auth=context.auth(args))
+    if job is None:
+        print("No such job: %s" % args.id, file=context.err)
+        return 1
+    write_one(args, context, job, JOB_COLUMNS)
+    return 0
+
+
+def do_delete_job(args, context):
+    r = context.client.delete_job(args.id, auth=context.auth(args))
+    if hasattr(r, 'status_code'):
+        return failure(r, context)
+    write_one(args, context, r, RESULT_COLUMNS)
+    return int(not r.get('success', True))
+
+
+def do_daemon(args, context):
+    auth = None
+    if args.refresh_token:
+        from .auth import OAuth2
+        auth = OAuth2(refresh_token=args.refresh_token,
+                      client_id=args.client_id,
+                      client_secret=args.client_secret)
+        auth.start_auto_refresh()
+    server = serve(args.socket, Context(auth=auth,
+                                        pool_maxsize=args.pool_maxsize))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    return 0
 
 
 # -----------------------------------------------------------------------------
 
 
-def diagnose(r, verbose=False):
+def diagnose(r, verbose, context):
+    import requests
+    out = context.out
     if isinstance(r, requests.Response):
-        print "Something went wrong:"
-        print
-        print r.content
+        failure(r, context)
         return False
     else:
         if 'message' in r:
-            print r['message']
+            print(r['message'], file=out)
         if verbose:
-            pprint(r)
+            pprint(r, stream=out)
         return r.get('success', True)
 
 
 # -----------------------------------------------------------------------------
 
 
-parser = ArgumentParser(prog="python -m cloudprinting")
-parser.add_argument(
-    '-v', '--verbose',
-    action="store_true",
-    dest="verbose")
-
-# ----
-
-parser__ = parser.add_subparsers()
-
-# ----
-
-list_printers_ = parser__.add_parser('list-printers')
-list_printers_.add_argument(
-    '--access-token',
-    required=True,
-    metavar='<token>',
-    dest='access_token')
-list_printers_.add_argument(
-    '--token-type',
-    default='Bearer',
-    metavar='<type>',
-    dest='token_type')
-list_printers_.set_defaults(main=do_list_printers)
-
-# ----
-
-print_ = parser__.add_parser('print')
-print_.add_argument(
-    '--access-token',
-    required=True,
-    metavar='<token>',
-    dest='access_token')
-print_.add_argument(
-    '--token-type',
-    default='Bearer',
-    metavar='<type>',
-    dest='token_type')
-print_.add_argument(
-    '--printer-id',
-    required=True,
-    metavar='<id>',
-    dest='printer_id')
-print_.add_argument(
-    '--tags',
-    dest="tags",
-    default='',
-    help="comma separated tags")
-print_.add_argument(
-    'path',
-    metavar='<path>')
-print_.set_defaults(main=do_print)
-
-# ----
-
-oauth2 = parser__.add_parser('oauth2')
-oauth2.add_argument(
-    '--client-id',
-    metavar='<id>',
-    required=True,
-    dest='client_id',
-    help='application "client id" (Google API)')
-oauth2.add_argument(
-    '--client-secret',
-    metavar='<secret>',
-    required=True,
-    dest='client_secret',
-    help='application "client secret" (Google API)')
-
-# ----
-
-oauth2__ = oauth2.add_subparsers()
-
-# ----
-
-oauth2__authorise = oauth2__.add_parser('authorise')
-oauth2__authorise.set_defaults(main=do_authorise)
-
-# ----
-
-oauth2__refresh = oauth2__.add_parser('refresh')
-oauth2__refresh.add_argument(
-    '--refresh-token',
-    required=True,
-    metavar='<token>',
-    dest='refresh_token')
-oauth2__refresh.set_defaults(main=do_refresh)
-
-# ----
-
-args = parser.parse_args()
-args.main(args)
+def serve(path, context):
+    """
+    Returns a server that runs commands sent to the UNIX socket at *path*,
+    or raises `SystemExit` if another daemon is listening there.
+
+    Each connection sends one line of JSON, ``{"argv": [...], "cwd": ...}``
+    (and ``"stdin"``, if the command reads it). The output is sent back as it's
+    written, one ``{"output": ...}`` (or ``{"error": ...}``) line at a time,
+    followed by ``{"status": ...}``.
+    """
+    try:
+        import socketserver
+    except ImportError:
+        import SocketServer as socketserver
+    parser = build_parser()
+
+    class Output(object):
+        def __init__(self, wfile, stream="output"):
+            self.wfile = wfile
+            self.stream = stream
+
+        def write(self, text):
+            if text:
+                self.send({self.stream: text})
+
+        def send(self, message):
+            self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+            request = json.loads(line.decode("utf-8"))
+            out = Output(self.wfile)
+            err = Output(self.wfile, "error")
+            call = context.writing_to(out, err)
+            try:
+                args = parser.parse_args(request['argv'])
+                if args.command in FORWARDED:
+                    args.cwd = request.get('cwd') or os.getcwd()
+                    args.stdin = StringIO(request.get('stdin')
+                                          or text_type())
+                    status = args.main(args, call)
+                else:
+                    print("the daemon doesn't run %r" % args.command,
+                          file=err)
+                    status = 2
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+                if e.code is not None and not isinstance(e.code, int):
+                    print(e.code, file=err)
+            except Exception as e:
+                status = 1
+                print("%s: %s" % (type(e).__name__, e), file=err)
+            out.send({"status": status})
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error as e:
+            if e.errno != errno.ECONNREFUSED:
+                raise
+            # left behind by a daemon that's no longer running
+            os.remove(path)
+        else:
+            raise SystemExit("a daemon is already listening on %s" % path)
+        finally:
+            probe.close()
+    umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    finally:
+        os.umask(umask)
+    server.daemon_threads = True
+    return server
+
+
+def forward(path, argv, out=None, err=None, stdin=None):
+    """
+    Run a command in the daemon listening at *path*.
+
+    :param stdin: file the command reads from standard input
+    :returns: the exit status, or `None` if no daemon is listening
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(path)
+        except socket.error:
+            return None
+        request = {"argv": list(argv), "cwd": os.getcwd()}
+        if stdin is not None:
+            request['stdin'] = stdin.read()
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        responses = connection.makefile('rb')
+        try:
+            for line in responses:
+                response = json.loads(line.decode("utf-8"))
+                if 'output' in response:
+                    out.write(response['output'])
+                    out.flush()
+                if 'error' in response:
+                    err.write(response['error'])
+                if 'status' in response:
+                    return response['status']
+        finally:
+            responses.close()
+    finally:
+        connection.close()
+    return 1
+
+
+# -----------------------------------------------------------------------------
+
+
+def add_token_arguments(parser):
+    parser.add_argument(
+        '--access-token',
+        metavar='<token>',
+        dest='access_token',
+        help="required unless a daemon with a refresh token is running")
+    parser.add_argument(
+        '--token-type',
+        default='Bearer',
+        metavar='<type>',
+        dest='token_type')
+
+
+def add_format_argument(parser, default="text"):
+    parser.add_argument(
+        '--format',
+        choices=("text", "json", "jsonl", "tsv"),
+        default=default,
+        dest='format',
+        help="output format, default: %s" % default)
+
+
+def add_client_arguments(parser, required=True):
+    parser.add_argument(
+        '--client-id',
+        metavar='<id>',
+        required=required,
+        dest='client_id',
+        help='application "client id" (Google API)')
+    parser.add_argument(
+        '--client-secret',
+        metavar='<secret>',
+        required=required,
+        dest='client_secret',
+        help='application "client secret" (Google API)')
+
+
+def build_parser():
+    parser = ArgumentParser(prog="python -m cloudprinting")
+    parser.add_argument(
+        '-v', '--verbose',
+        action="store_true",
+        dest="verbose")
+    parser.add_argument(
+        '--socket',
+        default=os.environ.get('CLOUDPRINTING_SOCKET', DEFAULT_SOCKET),
+        metavar='<path>',
+        dest='socket',
+        help="UNIX socket of the daemon")
+    parser.add_argument(
+        '--no-daemon',
+        action="store_false",
+        dest="use_daemon",
+        help="don't forward the command to a daemon")
+
+    # ----
+
+    parser__ = parser.add_subparsers(dest="command")
+
+    # ----
+
+    list_printers_ = parser__.add_parser('list-printers')
+    add_token_arguments(list_printers_)
+    add_format_argument(list_printers_)
+    list_printers_.set_defaults(main=do_list_printers)
+
+    # ----
+
+    list_jobs = parser__.add_parser('list-jobs')
+    add_token_arguments(list_jobs)
+    add_format_argument(list_jobs)
+    list_jobs.add_argument(
+        '--printer-id',
+        metavar='<id>',
+        dest='printer_id')
+    list_jobs.add_argument(
+        '--status',
+        metavar='<status>',
+        dest='status',
+        help="e.g. QUEUED, IN_PROGRESS, DONE, ERROR")
+    list_jobs.add_argument(
+        '--page-size',
+        type=int,
+        default=100,
+        metavar='<n>',
+        dest='page_size')
+    list_jobs.set_defaults(main=do_list_jobs)
+
+    # ----
+
+    get_job = parser__.add_parser('get-job')
+    add_token_arguments(get_job)
+    add_format_argument(get_job)
+    get_job.add_argument(
+        '--printer-id',
+        metavar='<id>',
+        dest='printer_id')
+    get_job.add_argument(
+        'id',
+        metavar='<job id>')
+    get_job.set_defaults(main=do_get_job)
+
+    # ----
+
+    delete_job = parser__.add_parser('delete-job')
+    add_token_arguments(delete_job)
+    add_format_argument(delete_job)
+    delete_job.add_argument(
+        'id',
+        metavar='<job id>')
+    delete_job.set_defaults(main=do_delete_job)
+
+    # ----
+
+    print_ = parser__.add_parser('print')
+    add_token_arguments(print_)
+    add_format_argument(print_)
+    print_.add_argument(
+        '--printer-id',
+        required=True,
+        metavar='<id>',
+        dest='printer_id')
+    print_.add_argument(
+        '--tags',
+        dest="tags",
+        default='',
+        help="comma separated tags")
+    print_.add_argument(
+        'path',
+        metavar='<path>')
+    print_.set_defaults(main=do_print)
+
+    # ----
+
+    print_batch = parser__.add_parser(
+        'print-batch',
+        help="print many documents, writing the outcomes as JSON lines")
+    add_token_arguments(print_batch)
+    add_format_argument(print_batch, default="jsonl")
+    print_batch.add_argument(
+        '--printer-id',
+        metavar='<id>',
+        dest='printer_id',
+        help="printer for paths, and manifest entries without a printer")
+    print_batch.add_argument(
+        '--tags',
+        dest="tags",
+        default='',
+        help="comma separated tags")
+    print_batch.add_argument(
+        '--concurrency',
+        type=int,
+        default=8,
+        metavar='<n>',
+        dest='concurrency',
+        help="maximum number of documents submitted at once")
+    print_batch.add_argument(
+        '--per-printer-limit',
+        type=int,
+        metavar='<n>',
+        dest='per_printer_limit',
+        help="maximum number of documents submitted at once to a printer")
+    print_batch.add_argument(
+        'paths',
+        nargs='*',
+        metavar='<path>',
+        help='paths or glob patterns; "-" or none reads a manifest of JSON '
+             'lines from stdin, e.g. {"path": ..., "printer": ..., '
+             '"title": ..., "tags": [...], "capabilities": [...]}')
+    print_batch.set_defaults(main=do_print_batch)
+
+    # ----
+
+    daemon = parser__.add_parser(
+        'daemon',
+        help="keep connections and tokens warm for later commands")
+    add_client_arguments(daemon, required=False)
+    daemon.add_argument(
+        '--refresh-token',
+        metavar='<token>',
+        dest='refresh_token',
+        help="used by commands that don't give an access token")
+    daemon.add_argument(
+        '--pool-size',
+        type=int,
+        default=32,
+        metavar='<n>',
+        dest='pool_maxsize',
+        help="maximum number of connections kept open")
+    daemon.set_defaults(main=do_daemon)
+
+    # ----
+
+    oauth2 = parser__.add_parser('oauth2')
+    add_client_arguments(oauth2)
+    add_format_argument(oauth2)
+
+    # ----
+
+    oauth2__ = oauth2.add_subparsers()
+
+    # ----
+
+    oauth2__authorise = oauth2__.add_parser('authorise')
+    oauth2__authorise.set_defaults(main=do_authorise)
+
+    # ----
+
+    oauth2__refresh = oauth2__.add_parser('refresh')
+    oauth2__refresh.add_argument(
+        '--refresh-token',
+        required=True,
+        metavar='<token>',
+        dest='refresh_token')
+    oauth2__refresh.set_defaults(main=do_refresh)
+
+    return parser
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'main'):
+        parser.error("too few arguments")
+    reads_stdin = (args.command == "print-batch"
+                   and (not args.paths or "-" in args.paths))
+    if args.command in FORWARDED and args.use_daemon:
+        status = forward(args.socket, argv,
+                         stdin=sys.stdin if reads_stdin else None)
+        if status is not None:
+            return status
+    args.cwd = os.getcwd()
+    args.stdin = sys.stdin
+    context = Context(pool_maxsize=max(getattr(args, 'concurrency', 0), 10))
+    return args.main(args, context)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+# coding: utf-8
+"""
+An asyncio client for Google Cloud Print, built on aiohttp.
+"""
+import asyncio
+import json
+import mimetypes
+from os.path import basename
+import weakref
+
+import aiohttp
+
+from . import client
+from .auth import OAuth2
+
+
+CHUNK_SIZE = 65536
+
+
+def _running_loop():
+    """
+    Returns the event loop of the running coroutine.
+    """
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:
+        # Python 3.6
+        return asyncio.get_event_loop()
+
+
+class AsyncCloudPrintClient(object):
+    """
+    An asyncio counterpart to `CloudPrintClient`.
+
+    :param           auth: `OAuth2` authentication used when a call doesn't
+                           provide its own ``auth``
+    :param       base_url: root of the API, defaults to `CLOUDPRINT_URL`
+    :type        base_url: string
+    :param          limit: maximum number of open connections
+    :type           limit: int
+    :param limit_per_host: maximum number of open connections per host, ``0``
+                           means no limit
+    :type  limit_per_host: int
+    :param        session: an existing `aiohttp.ClientSession` to use
+    :param        limiter: rate limits for submitting and deleting jobs
+    :type         limiter: `scheduler.RateLimiter`
+
+    Connections are pooled by a single `aiohttp.ClientSession`, which is
+    created on first use. Expired `OAuth2` tokens are refreshed without
+    blocking the event loop, and concurrent calls wait on the same refresh
+    rather than each performing their own. With a *limiter*, submissions and
+    deletions wait (without blocking the event loop) until they're within the
+    limits of the account and printer.
+
+    Extra keyword arguments to each method are passed on to `aiohttp`.
+
+    Example::
+
+        >>> async with AsyncCloudPrintClient(auth=auth) as client:
+        ...     results = await client.submit_many(
+        ...         {"printer": printer, "content": path} for path in paths)
+
+    """
+    def __init__(self, auth=None, base_url=None, limit=100, limit_per_host=0,
+                 session=None, limiter=None):
+        self.auth = auth
+        self.base_url = base_url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = session
+        self.limiter = limiter
+        self._refresh_locks = weakref.WeakKeyDictionary()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        Close all pooled connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _url(self, path):
+        return (self.base_url or client.CLOUDPRINT_URL) + path
+
+    async def refresh(self, auth):
+        """
+        Refresh the access token of an `OAuth2` if it has expired.
+
+        Concurrent callers share a single request to the token endpoint,
+        which is made by `OAuth2.refresh` in a worker thread, so its token
+        store and instrumentation are used.
+        """
+        lock = self._refresh_locks.get(auth)
+        if lock is None:
+            lock = self._refresh_locks[auth] = asyncio.Lock()
+        async with lock:
+            if not auth.expired:
+                return
+            await _running_loop().run_in_executor(None, auth.refresh)
+
+    async def _limit(self, printer=None):
+        """
+        Wait until a call for *printer* is within the rate limits.
+        """
+        if self.limiter is not None:
+            delay = self.limiter.reserve(printer)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _authorization(self, auth):
+        if auth.expired:
+            await self.refresh(auth)
+        return "%s %s" % (auth.token_type, auth.access_token)
+
+    async def _request(self, method, path, auth=None, data=None, **kwargs):
+        """
+        Perform a request and return the decoded API response, or the HTTP
+        response on failure.
+
+        *data* may be a callable that returns the request body, which allows
+        the body to be rebuilt if the request has to be sent again.
+        """
+        if auth is None:
+            auth = self.auth
+        if auth is not None and not isinstance(auth, OAuth2):
+            raise TypeError("Only OAuth2 authentication is supported.")
+        refreshable = auth is not None and auth.refreshable
+        headers = dict(kwargs.pop('headers', None) or {})
+
+        while True:
+            if auth is not None:
+                headers['Authorization'] = await self._authorization(auth)
+            body = data() if callable(data) else data
+            async with self.session.request(method, self._url(path),
+                                            data=body, headers=headers,
+                                            **kwargs) as r:
+                if r.status == 403 and refreshable:
+                    # retry one time with a fresh token
+                    refreshable = False
+                    with auth.lock:
+                        # don't discard a token another call refreshed
+                        if headers['Authorization'] == "%s %s" % (
+                                auth.token_type, auth.access_token):
+                            auth.expired = True
+                    continue
+                if r.status != 200:
+                    await r.read()
+                    return r
+                # At the time of writing, the `/jobs` API returns
+                # `Content-Type: text/plain` header
+                return json.loads(await r.text())
+
+    async def get_job(self, id, printer=None, **kwargs):
+        """
+        Returns the data for a single job, see `CloudPrintClient.get_job`.
+        """
+        jobs = await self.list_jobs(printer=printer, **kwargs)
+        if isinstance(jobs, aiohttp.ClientResponse):
+            return None
+        for job in jobs:
+            if job['id'] == id:
+                return job
+
+    async def delete_job(self, id, printer=None, **kwargs):
+        """
+        Delete a print job, see `CloudPrintClient.delete_job`. *printer* is
+        only used for rate limiting.
+        """
+        await self._limit(printer)
+        return await self._request("POST", "/deletejob", data={"jobid": id},
+                                   **kwargs)
+
+    async def list_jobs(self, printer=None, **kwargs):
+        """
+        List print jobs, see `CloudPrintClient.list_jobs`.
+        """
+        params = {}
+        if printer is not None:
+            params["printerid"] = printer
+        r = await self._request("GET", "/jobs", params=params, **kwargs)
+        return r if isinstance(r, aiohttp.ClientResponse) else r['jobs']
+
+    async def list_printers(self, **kwargs):
+        """
+        List registered printers, see `CloudPrintClient.list_printers`.
+        """
+        return await self._request("GET", "/search", **kwargs)
+
+    async def submit_job(self, printer, content, title=None,
+                         capabilities=None, tags=None, content_type=None,
+                         **kwargs):
+        """
+        Submit a print job, see `CloudPrintClient.submit_job`.
+
+        The document is streamed from disk (or the file-like object) rather
+        than read into memory.
+        """
+        loop = _running_loop()
+        if isinstance(content, (list, tuple)):
+            name, f = content
+            opened = False
+        else:
+            name = basename(content)
+            # file I/O happens in a thread, so the event loop isn't blocked
+            f = await loop.run_in_executor(None, open, content, 'rb')
+            opened = True
+        try:
+            start = f.tell()
+        except (AttributeError, IOError, OSError):
+            start = None
+
+        if title is None:
+            title = name
+
+        if capabilities is None:
+            # magic default value
+            capabilities = [{}]
+
+        fields = [("printerid", printer),
+                  ("title", title),
+                  ("contentType",
+                   content_type or mimetypes.guess_type(name)[0] or ""),
+                  ("capabilities",
+                   json.dumps({"capabilities": capabilities}))]
+        fields.extend(("tag", tag) for tag in tags or ())
+
+        async def read():
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+        def form():
+            if start is not None:
+                f.seek(start)
+            data = aiohttp.FormData()
+            for key, value in fields:
+                data.add_field(key, value)
+            data.add_field("content", read(), filename=name,
+                           content_type="application/octet-stream")
+            return data
+
+        try:
+            await self._limit(printer)
+            return await self._request("POST", "/submit", data=form,
+                                       **kwargs)
+        finally:
+            if opened:
+                await loop.run_in_executor(None, f.close)
+
+    async def submit_many(self, specs, concurrency=100, **kwargs):
+        """
+        Submit many print jobs concurrently.
+
+        :param       specs: keyword arguments for `submit_job`, one per job
+        :type        specs: iterable of `dict`
+        :param concurrency: maximum number of jobs being submitted at once
+        :type  concurrency: int
+        :returns: `list` with a result for each spec, in the same order; a
+                  failed submission is represented by its exception
+
+        Extra keyword arguments are passed to every `submit_job` call.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def submit(spec):
+            async with semaphore:
+                options = dict(kwargs)
+                options.update(spec)
+                return await self.submit_job(**options)
+
+        return await asyncio.gather(*[submit(spec) for spec in specs],
+                                    return_exceptions=True)
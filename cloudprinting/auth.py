@@ -1,7 +1,9 @@
 # coding: utf-8
+from hashlib import sha1
 import threading
 from time import sleep, time
 import requests
+from .compat import text_type
 
 
 try:
@@ -70,13 +72,31 @@ class OAuth2(object):
     Alternatively the later arguments can be provided, which allows then
     authentication tokens to be refreshed when they expire. In this scenario,
     it's not necessary to provide the former arguments.
+
+    When the lifetime of the access token is known (*expires_in*, or from a
+    refresh), the token is refreshed *refresh_margin* seconds before it
+    expires, rather than after a request has been rejected. Concurrent
+    requests wait on a single refresh. `start_auto_refresh` moves refreshing
+    to a background thread, so requests never wait for it.
+
+    A *store* (see `cloudprinting.tokens`) shares access tokens between
+    instances with the same credentials, including in other processes. Before
+    refreshing, the store is checked for a token another instance has already
+    refreshed, and the store is locked while refreshing, so only one refresh
+    happens each time the token expires.
+
+    Each refresh is reported to *instrumentation* (see
+    `cloudprinting.instrument`), including whether the token came from the
+    token endpoint or the store.
     """
     token_endpoint = "https://accounts.google.com/o/oauth2/token"
     device_code_endpoint = "https://accounts.google.com/o/oauth2/device/code"
     scope = "https://www.googleapis.com/auth/cloudprint"
 
     def __init__(self, access_token=None, token_type=None,
-                 refresh_token=None, client_id=None, client_secret=None):
+                 refresh_token=None, client_id=None, client_secret=None,
+                 expires_in=None, refresh_margin=60, store=None,
+                 instrumentation=None):
         if not ((access_token and token_type)
                 or (refresh_token and client_id and client_secret)):
             raise TypeError("Invalid argument combination. Provide either "
@@ -88,8 +108,37 @@ class OAuth2(object):
         self.refresh_token = refresh_token
         self.client_id = client_id
         self.client_secret = client_secret
+        self.expires_at = time() + expires_in if expires_in else None
+        self.refresh_margin = refresh_margin
+        self.store = store
+        self.instrumentation = instrumentation
         self.expired = not (access_token and token_type)
         self.lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self._stopping = threading.Event()
+
+    @property
+    def refreshable(self):
+        """
+        `True` if the credentials needed to refresh the token are available.
+        """
+        return bool(self.client_id and self.client_secret
+                    and self.refresh_token)
+
+    @property
+    def expired(self):
+        """
+        `True` if the access token needs to be refreshed before it's used.
+        """
+        if self._expired:
+            return True
+        return (self.expires_at is not None and self.refreshable
+                and time() >= self.expires_at - self.refresh_margin)
+
+    @expired.setter
+    def expired(self, value):
+        self._expired = value
 
     def _stamp(self, r):
         """
@@ -99,24 +148,37 @@ class OAuth2(object):
                                                 self.access_token)
 
     def __call__(self, r):
-        with self.lock:
-            if self.expired:
-                self.refresh()
+        if self.expired:
+            self.refresh()
 
         self._stamp(r)
 
-        if self.client_id and self.client_secret and self.refresh_token:
+        if self.refreshable:
             # enable auto refreshing of token
-            def hook(response):
+            stale = r.headers['Authorization']
+
+            def hook(response, **kwargs):
                 if response.status_code == requests.codes.forbidden:
-                    self.expired = True
+                    with self.lock:
+                        # don't discard a token another request refreshed
+                        if stale == "%s %s" % (self.token_type,
+                                               self.access_token):
+                            self.expired = True
                     self.refresh()
-                    if not self.expired:
-                        request = response.request
+                    # a streamed body has been consumed, so can't be sent
+                    # again, but later requests use the new token
+                    if not self.expired and isinstance(
+                            response.request.body,
+                            (bytes, text_type, type(None))):
+                        # release the connection, then retry one time
+                        response.content
+                        response.close()
+                        request = response.request.copy()
                         self._stamp(request)
-                        request.deregister_hook('response', hook)  # retry one time
-                        request.send(anyway=True)
-                        return request.response
+                        retry = response.connection.send(request, **kwargs)
+                        retry.history.append(response)
+                        retry.request = request
+                        return retry
                 return response
             r.hooks['response'].insert(0, hook)
         return r
@@ -124,18 +186,139 @@ class OAuth2(object):
     def refresh(self):
         """
         Refresh the ``access_code`` -- this is useful when it expires.
+
+        If another thread is already refreshing the token, this waits for it
+        rather than making another request.
         """
-        with self.lock:
+        with self._refresh_lock:
             if not self.expired:
                 return
-        r = requests.post(self.token_endpoint, data={
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "refresh_token": self.refresh_token,
-            "grant_type": "refresh_token"}).json()
-        self.access_token = r['access_token']
-        self.expired = False
-        self.token_type = r['token_type']
+            if self.instrumentation is None:
+                self._refresh()
+                return
+            started = time()
+            try:
+                source = self._refresh()
+            except Exception as e:
+                self.instrumentation.token_refresh(time() - started,
+                                                   "endpoint", error=e)
+                raise
+            self.instrumentation.token_refresh(time() - started, source)
+
+    def _refresh(self):
+        """
+        Refresh the token, returning where it came from: ``"endpoint"`` or
+        ``"store"``.
+        """
+        if self.store is None:
+            r = requests.post(self.token_endpoint,
+                              data=self._refresh_data()).json()
+            self._update(r)
+            return "endpoint"
+        key = self.store_key
+        with self.store.lock(key):
+            tokens = self.store.get(key)
+            if tokens and self._load(tokens):
+                return "store"
+            r = requests.post(self.token_endpoint,
+                              data=self._refresh_data()).json()
+            self._update(r)
+            self.store.set(key, {"access_token": self.access_token,
+                                 "token_type": self.token_type,
+                                 "expires_at": self.expires_at})
+            return "endpoint"
+
+    @property
+    def store_key(self):
+        """
+        Identifies the credentials in a token store, without revealing them.
+        """
+        return sha1(("%s:%s" % (self.client_id, self.refresh_token))
+                    .encode("utf-8")).hexdigest()
+
+    def _load(self, tokens):
+        """
+        Use tokens from the store, if they're newer than ours and not
+        expired. Returns `True` if they were used.
+        """
+        with self.lock:
+            if tokens['access_token'] == self.access_token:
+                return False
+            previous = (self.access_token, self.token_type, self.expires_at,
+                        self._expired)
+            self.access_token = tokens['access_token']
+            self.token_type = tokens['token_type']
+            self.expires_at = tokens.get('expires_at')
+            self.expired = False
+            if self.expired:
+                (self.access_token, self.token_type, self.expires_at,
+                 self._expired) = previous
+                return False
+            return True
+
+    def _refresh_data(self):
+        """
+        Form data to POST to ``token_endpoint`` to refresh the access token.
+        """
+        return {"client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "refresh_token": self.refresh_token,
+                "grant_type": "refresh_token"}
+
+    def _update(self, tokens):
+        """
+        Use the tokens from a ``token_endpoint`` response.
+        """
+        with self.lock:
+            self.access_token = tokens['access_token']
+            self.token_type = tokens['token_type']
+            self.refresh_token = tokens.get('refresh_token',
+                                            self.refresh_token)
+            expires_in = tokens.get('expires_in')
+            self.expires_at = time() + expires_in if expires_in else None
+            self.expired = False
+
+    def start_auto_refresh(self, retry_interval=10):
+        """
+        Refresh the token in a background thread before it expires.
+
+        :param retry_interval: seconds to wait before retrying a failed
+                               refresh
+        :type  retry_interval: float
+        """
+        if not self.refreshable:
+            raise TypeError("Automatic refreshing requires <refresh_token, "
+                "client_id, client_secret>.")
+        if self._refresher is not None:
+            return
+        self._stopping.clear()
+
+        def run():
+            while not self._stopping.is_set():
+                try:
+                    self.refresh()
+                except (requests.RequestException, KeyError, ValueError):
+                    delay = retry_interval
+                else:
+                    if self.expires_at is None:
+                        delay = retry_interval
+                    else:
+                        delay = max(self.expires_at - self.refresh_margin
+                                    - time(), 1)
+                self._stopping.wait(delay)
+
+        self._refresher = threading.Thread(target=run, name="OAuth2 refresh")
+        self._refresher.daemon = True
+        self._refresher.start()
+
+    def stop_auto_refresh(self):
+        """
+        Stop the background thread started by `start_auto_refresh`.
+        """
+        self._stopping.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
 
     @classmethod
     def authorise_device(cls, client_id, client_secret):
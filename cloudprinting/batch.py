@@ -0,0 +1,159 @@
+# coding: utf-8
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import time
+import requests
+
+
+class Outcome(object):
+    """
+    The outcome of a single operation in a `Batch`.
+
+    :ivar    item: the input the operation was performed for
+    :ivar  result: API response data as `dict`, or the HTTP response on
+                   failure, or `None` if an exception was raised
+    :ivar   error: the exception raised, or `None`
+    :ivar elapsed: seconds the operation took
+    """
+    def __init__(self, item, result=None, error=None, elapsed=0):
+        self.item = item
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        """
+        `True` if the operation succeeded.
+        """
+        if self.error is not None or isinstance(self.result,
+                                                requests.Response):
+            return False
+        return bool(self.result is None or self.result.get('success', True))
+
+
+class Batch(object):
+    """
+    Performs an operation for many items in a thread pool, yielding an
+    `Outcome` for each item as it finishes.
+
+    :param           func: the operation, called with each item
+    :param          items: the items, which are consumed lazily
+    :type           items: iterable
+    :param    max_workers: maximum number of operations in progress
+    :type     max_workers: int
+    :param            key: returns the key of an item (e.g. its printer),
+                           used to apply *per_key_limit*
+    :param  per_key_limit: maximum number of operations in progress for items
+                           with the same key
+    :type   per_key_limit: int
+
+    Exceptions are caught and reported in the `Outcome` rather than stopping
+    the batch. Nothing happens until the batch is iterated, and the counters
+    are updated as it progresses::
+
+        >>> batch = client.submit_jobs(specs, max_workers=16)
+        >>> failures = [outcome for outcome in batch if not outcome.ok]
+        >>> batch.throughput
+        42.1
+
+    """
+    def __init__(self, func, items, max_workers=8, key=None,
+                 per_key_limit=None):
+        self.func = func
+        self.items = items
+        self.max_workers = max_workers
+        self.key = key
+        self.per_key_limit = per_key_limit
+        self.completed = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the batch started, until it finished.
+        """
+        if self.started_at is None:
+            return 0
+        return (self.finished_at or time()) - self.started_at
+
+    @property
+    def throughput(self):
+        """
+        Operations completed per second.
+        """
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed else 0.0
+
+    def _call(self, item):
+        started = time()
+        try:
+            result = self.func(item)
+        except Exception as e:
+            return Outcome(item, error=e, elapsed=time() - started)
+        return Outcome(item, result=result, elapsed=time() - started)
+
+    def __iter__(self):
+        self.started_at = time()
+        items = iter(self.items)
+        exhausted = False
+        limit = self.per_key_limit
+        # items held back because their key is at its limit
+        waiting = {}
+        held = 0
+        running = {}
+        counts = {}
+
+        def ready():
+            for key, queue in waiting.items():
+                if counts.get(key, 0) < limit:
+                    item = queue.popleft()
+                    if not queue:
+                        del waiting[key]
+                    return key, item
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while len(running) < self.max_workers:
+                    found = ready() if waiting else None
+                    if found is not None:
+                        held -= 1
+                        key, item = found
+                    elif exhausted or held >= self.max_workers * 4:
+                        break
+                    else:
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        try:
+                            key = self.key(item) if self.key else None
+                        except Exception as e:
+                            # an item without a key can't be performed
+                            self.completed += 1
+                            self.failed += 1
+                            yield Outcome(item, error=e)
+                            continue
+                        if limit and counts.get(key, 0) >= limit:
+                            waiting.setdefault(key, deque()).append(item)
+                            held += 1
+                            continue
+                    counts[key] = counts.get(key, 0) + 1
+                    running[executor.submit(self._call, item)] = key
+
+                if not running:
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    counts[key] -= 1
+                    outcome = future.result()
+                    self.completed += 1
+                    if not outcome.ok:
+                        self.failed += 1
+                    yield outcome
+        self.finished_at = time()
@@ -0,0 +1,239 @@
+# coding: utf-8
+"""
+Benchmarks the client against a local `MockCloudPrintServer`.
+
+Usage::
+
+    python -m cloudprinting.benchmark [--jobs N] [--concurrency N]
+                                      [--size BYTES] [--latency SECONDS]
+                                      [--failure-rate P] [scenario ...]
+
+Each scenario runs in a fresh interpreter, so its peak RSS isn't affected by
+the others. Results are reported as jobs (calls) per second, p50/p99 latency
+and peak RSS of the process.
+"""
+from argparse import ArgumentParser, SUPPRESS
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _timed(func, count, concurrency):
+    """
+    Call *func* *count* times from *concurrency* threads, returning the
+    latency of each call.
+    """
+    def call(i):
+        started = time()
+        func(i)
+        return time() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(call, range(count)))
+
+
+def _submit(client, args):
+    return _timed(lambda i: client.submit_job(args.printer, args.document),
+                  args.jobs, args.concurrency)
+
+
+def _submit_streaming(client, args):
+    return _timed(lambda i: client.submit_job(args.printer, args.document,
+                                              streaming=True),
+                  args.jobs, args.concurrency)
+
+
+def _submit_jobs(client, args):
+    specs = ({"printer": args.printer, "content": args.document}
+             for i in range(args.jobs))
+    return [outcome.elapsed for outcome in
+            client.submit_jobs(specs, max_workers=args.concurrency)]
+
+
+def _list_jobs(client, args):
+    return _timed(lambda i: client.list_jobs(printer=args.printer),
+                  args.jobs, args.concurrency)
+
+
+def _list_printers(client, args):
+    return _timed(lambda i: client.list_printers(), args.jobs,
+                  args.concurrency)
+
+
+def _get_job(client, args):
+    jobs = client.list_jobs(printer=args.printer)
+    ids = [job['id'] for job in jobs] if isinstance(jobs, list) else []
+    # when run on its own there are no jobs yet, so submit one to look up
+    attempts = 0
+    while not ids:
+        if attempts == 10:
+            raise RuntimeError("Unable to submit a job to look up.")
+        attempts += 1
+        r = client.submit_job(args.printer, args.document)
+        if isinstance(r, dict) and r.get('success'):
+            ids.append(r['job']['id'])
+    return _timed(lambda i: client.get_job(ids[i % len(ids)],
+                                           printer=args.printer),
+                  args.jobs, args.concurrency)
+
+
+def _get_job_cached(client, args):
+    from .cache import JobCache
+    client.job_cache = JobCache()
+    return _get_job(client, args)
+
+
+def _oauth2_refresh(client, args):
+    from .auth import OAuth2
+    auth = OAuth2(client_id="client", client_secret="secret",
+                  refresh_token="refresh")
+    auth.token_endpoint = args.url + "/token"
+
+    def refresh(i):
+        auth.expired = True
+        auth.refresh()
+
+    return _timed(refresh, args.jobs, 1)
+
+
+SCENARIOS = [
+    ("submit", _submit),
+    ("submit-streaming", _submit_streaming),
+    ("submit-jobs", _submit_jobs),
+    ("list-jobs", _list_jobs),
+    ("list-printers", _list_printers),
+    ("get-job", _get_job),
+    ("get-job-cached", _get_job_cached),
+    ("oauth2-refresh", _oauth2_refresh),
+]
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in KiB, or `None` if
+    it's not available.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on OS X, KiB elsewhere
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def percentile(values, p):
+    """
+    Returns the *p* percentile (0-100) of *values*.
+    """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(round(p / 100.0 * (len(values) - 1))),
+                      len(values) - 1)]
+
+
+def run_scenario(name, args):
+    """
+    Run a single scenario in this process, returning its results.
+    """
+    from .client import CloudPrintClient
+    func = dict(SCENARIOS)[name]
+    client = CloudPrintClient(base_url=args.url,
+                              pool_maxsize=max(args.concurrency, 10))
+    started = time()
+    latencies = func(client, args)
+    elapsed = time() - started
+    client.close()
+    return {"scenario": name,
+            "calls": len(latencies),
+            "per_second": len(latencies) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "peak_rss": peak_rss()}
+
+
+def _document(size):
+    """
+    Create a temporary document of *size* bytes, returning its path.
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, 'wb') as f:
+        chunk = b"%PDF" + b"\0" * 65532
+        while size > 0:
+            f.write(chunk[:size])
+            size -= len(chunk)
+    return path
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog="python -m cloudprinting.benchmark")
+    parser.add_argument('--jobs', type=int, default=200,
+                        help="calls per scenario")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="threads making calls")
+    parser.add_argument('--size', type=int, default=1024 * 1024,
+                        help="size of submitted documents in bytes")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds the server takes to respond")
+    parser.add_argument('--failure-rate', type=float, default=0,
+                        dest='failure_rate',
+                        help="probability of a request failing")
+    parser.add_argument('--json', action='store_true',
+                        help="output results as JSON lines")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help="scenarios to run (default: all): %s"
+                        % ", ".join(name for name, _ in SCENARIOS))
+    # used internally to run a scenario in a child process
+    parser.add_argument('--run', help=SUPPRESS)
+    parser.add_argument('--url', help=SUPPRESS)
+    parser.add_argument('--printer', help=SUPPRESS)
+    parser.add_argument('--document', help=SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        sys.stdout.write(json.dumps(run_scenario(args.run, args)) + "\n")
+        return
+
+    from .testing import MockCloudPrintServer
+    names = args.scenarios or [name for name, _ in SCENARIOS]
+    document = _document(args.size)
+    try:
+        with MockCloudPrintServer(latency=args.latency,
+                                  failure_rate=args.failure_rate) as server:
+            if not args.json:
+                sys.stdout.write("%-18s %8s %10s %10s %10s %12s\n" % (
+                    "scenario", "calls", "calls/s", "p50 (ms)", "p99 (ms)",
+                    "peak RSS (KiB)"))
+            for name in names:
+                output = subprocess.check_output([
+                    sys.executable, "-m", "cloudprinting.benchmark",
+                    "--run", name, "--url", server.url,
+                    "--printer", server.printers[0]['id'],
+                    "--document", document,
+                    "--jobs", str(args.jobs),
+                    "--concurrency", str(args.concurrency)])
+                result = json.loads(output.decode("utf-8"))
+                if args.json:
+                    sys.stdout.write(json.dumps(result) + "\n")
+                else:
+                    sys.stdout.write("%-18s %8d %10.1f %10.2f %10.2f %12s\n"
+                                     % (name, result['calls'],
+                                        result['per_second'],
+                                        result['p50'] * 1000,
+                                        result['p99'] * 1000,
+                                        result['peak_rss']))
+                sys.stdout.flush()
+    finally:
+        os.unlink(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# coding: utf-8
+from collections import OrderedDict
+from hashlib import sha1
+import mimetypes
+import os
+import threading
+from time import time
+
+
+class JobCache(object):
+    """
+    An index of jobs by ID, populated from `list_jobs` responses.
+
+    :param     ttl: seconds a job (or listing) is considered up-to-date
+    :type      ttl: float
+    :param maxsize: maximum number of jobs kept, the least recently used jobs
+                    are evicted first
+    :type  maxsize: int
+
+    Every job in a listing is indexed, so a single `list_jobs` call can serve
+    many `get_job` lookups. It's safe to share a cache between threads.
+    """
+    def __init__(self, ttl=30, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self._jobs = OrderedDict()  # id -> (timestamp, job)
+        self._listings = {}  # printer id (or None for all) -> timestamp
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _fresh(self, timestamp, now):
+        return timestamp is not None and now - timestamp < self.ttl
+
+    def _store(self, job, now):
+        id = job['id']
+        self._jobs.pop(id, None)
+        self._jobs[id] = (now, job)
+
+    def _evict(self):
+        while len(self._jobs) > self.maxsize:
+            self._jobs.popitem(last=False)
+
+    def get(self, id):
+        """
+        Returns the cached job, or `None` if it's not cached or is stale.
+        """
+        now = time()
+        with self.lock:
+            entry = self._jobs.pop(id, None)
+            if entry is None:
+                return None
+            if not self._fresh(entry[0], now):
+                return None
+            self._jobs[id] = entry  # mark as most recently used
+            return entry[1]
+
+    def listed(self, printer=None):
+        """
+        Returns `True` if a listing covering *printer* is up-to-date, in which
+        case a job that isn't cached can be assumed not to exist.
+        """
+        now = time()
+        with self.lock:
+            return (self._fresh(self._listings.get(None), now)
+                    or self._fresh(self._listings.get(printer), now))
+
+    def add(self, job):
+        """
+        Add or replace a single job.
+        """
+        now = time()
+        with self.lock:
+            self._store(job, now)
+            self._evict()
+
+    def update(self, jobs, printer=None, complete=True):
+        """
+        Index the jobs from a `list_jobs` response for *printer*.
+
+        *complete* should be `False` if the listing was filtered or paged, as
+        jobs missing from it may still exist.
+        """
+        now = time()
+        with self.lock:
+            for job in jobs:
+                self._store(job, now)
+            if complete:
+                self._listings[printer] = now
+            self._evict()
+
+    def discard(self, id):
+        """
+        Remove a job, if it's cached.
+        """
+        with self.lock:
+            self._jobs.pop(id, None)
+
+    def clear(self):
+        """
+        Remove all jobs and listings.
+        """
+        with self.lock:
+            self._jobs.clear()
+            self._listings.clear()
+
+
+class Document(object):
+    """
+    A document prepared for submission by a `DocumentCache`.
+
+    :ivar       digest: SHA-1 of the content, as hex
+    :ivar      content: the content as `bytes`, or `None` if it's too large
+                        to cache
+    :ivar content_type: mimetype guessed from the name
+    :ivar         size: size of the content in bytes
+    :ivar          url: URL the content is published at, if any
+    """
+    __slots__ = ('digest', 'content', 'content_type', 'size', 'url')
+
+    def __init__(self, digest, content, content_type, size, url=None):
+        self.digest = digest
+        self.content = content
+        self.content_type = content_type
+        self.size = size
+        self.url = url
+
+
+class DocumentCache(object):
+    """
+    Caches documents by content, so documents submitted repeatedly aren't
+    read from disk and prepared again for each submission.
+
+    :param         max_bytes: maximum total size of cached content
+    :type          max_bytes: int
+    :param max_document_size: documents larger than this aren't cached
+    :type  max_document_size: int
+
+    Documents are identified by path, modification time and size, so a cached
+    document is only used while the file is unchanged. Files with the same
+    content share a single cached copy.
+
+    The submit API can print a document from a URL rather than an upload. If
+    a document is published at a URL (see `publish`), submissions of it send
+    only the URL::
+
+        >>> documents = DocumentCache()
+        >>> client = CloudPrintClient(auth=auth, document_cache=documents)
+        >>> documents.publish("label.pdf", "https://example.com/label.pdf")
+        >>> client.submit_job(printer, "label.pdf")  # no upload
+
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024,
+                 max_document_size=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_document_size = max_document_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._files = {}  # path -> ((mtime, size), digest)
+        self._paths = {}  # digest -> paths of files with the content
+        self._documents = OrderedDict()  # digest -> Document
+        self._urls = {}  # digest -> url
+
+    def _version(self, path):
+        stat = os.stat(path)
+        return (stat.st_mtime, stat.st_size)
+
+    def _forget(self, path):
+        entry = self._files.pop(path, None)
+        if entry is not None:
+            paths = self._paths[entry[1]]
+            paths.discard(path)
+            if not paths:
+                del self._paths[entry[1]]
+
+    def _hash(self, path, keep):
+        digest = sha1()
+        chunks = []
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(65536)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                if keep:
+                    chunks.append(chunk)
+        return digest.hexdigest(), b"".join(chunks) if keep else None
+
+    def load(self, path):
+        """
+        Returns the `Document` for the file at *path*, or `None` if it's too
+        large to cache and hasn't been published.
+        """
+        path = os.path.abspath(path)
+        version = self._version(path)
+        with self.lock:
+            entry = self._files.get(path)
+            digest = (entry[1] if entry is not None and entry[0] == version
+                      else None)
+            document = self._documents.pop(digest, None)
+            if document is not None:
+                self._documents[digest] = document  # most recently used
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        size = version[1]
+        keep = size <= self.max_document_size
+        if not keep and not self._urls:
+            return None
+        digest, content = self._hash(path, keep)
+        if not keep and digest not in self._urls:
+            return None
+        document = Document(digest, content,
+                            mimetypes.guess_type(path)[0], size,
+                            self._urls.get(digest))
+        with self.lock:
+            self._forget(path)
+            self._files[path] = (version, digest)
+            self._paths.setdefault(digest, set()).add(path)
+            existing = self._documents.pop(digest, None)
+            if existing is not None:
+                # same content under another name, share the copy
+                document.content = existing.content
+                self.size -= len(existing.content or b"")
+            self._documents[digest] = document
+            self.size += len(document.content or b"")
+            while self.size > self.max_bytes and self._documents:
+                evicted_digest, evicted = self._documents.popitem(last=False)
+                self.size -= len(evicted.content or b"")
+                for evicted_path in self._paths.pop(evicted_digest, ()):
+                    del self._files[evicted_path]
+        return document
+
+    def publish(self, document, url):
+        """
+        Submit *document* by *url* rather than uploading it.
+
+        :param document: path of the document, or its digest
+        :type  document: string
+        :param      url: publicly accessible URL of the same content
+        :type       url: string
+        """
+        if os.path.exists(document):
+            digest = self._hash(document, False)[0]
+        else:
+            digest = document
+        with self.lock:
+            self._urls[digest] = url
+            if digest in self._documents:
+                self._documents[digest].url = url
@@ -0,0 +1,104 @@
+# coding: utf-8
+import requests
+from .client import default_client
+
+
+class JobChangeFeed(object):
+    """
+    Lists only the jobs that were created or changed since the previous poll.
+
+    :param   printer: only follow jobs for this printer id
+    :type    printer: string
+    :param    client: client used to list jobs, defaults to the client used
+                      by the module-level functions
+    :type     client: `CloudPrintClient`
+    :param page_size: jobs fetched per request
+    :type  page_size: int
+
+    Extra keyword arguments are passed to `list_jobs`, e.g. ``auth`` or
+    ``status``.
+
+    Jobs are fetched newest first, a page at a time. The feed keeps a high
+    water mark (the newest creation time seen) and the update times of jobs
+    that haven't finished, and stops fetching once it reaches jobs older than
+    both, as finished jobs don't change. The cost of a poll is therefore
+    proportional to the new jobs and those since the oldest unfinished job,
+    rather than to the whole history::
+
+        >>> feed = JobChangeFeed(printer, auth=auth)
+        >>> feed.poll()  # the first poll returns every job
+        [...]
+        >>> feed.poll()
+        [{"id": ..., "status": "DONE", ...}]
+
+    """
+    terminal = frozenset(["DONE", "ERROR", "ABORTED"])
+
+    def __init__(self, printer=None, client=None, page_size=100, **kwargs):
+        self.printer = printer
+        self.client = client
+        self.page_size = page_size
+        self.kwargs = kwargs
+        self.high_water = None  # newest createTime seen (ms)
+        self._newest = set()  # ids of jobs created at *high_water*
+        self._active = {}  # id -> (createTime, updateTime, status)
+
+    def poll(self):
+        """
+        Returns a `list` of jobs created or changed since the previous poll,
+        or the HTTP response on failure.
+        """
+        floor = self.high_water
+        if floor is not None and self._active:
+            floor = min([floor] + [created for created, _, _
+                                   in self._active.values()])
+        client = self.client or default_client()
+        changed = []
+        seen = set()
+        active = {}
+        high_water = self.high_water
+        newest = set(self._newest)
+        offset = 0
+        while True:
+            jobs = client.list_jobs(printer=self.printer, offset=offset,
+                                    limit=self.page_size,
+                                    sortorder="CREATE_TIME_DESC",
+                                    **self.kwargs)
+            if isinstance(jobs, requests.Response):
+                return jobs
+            reached = False
+            for job in jobs:
+                id = job['id']
+                created = int(job.get('createTime') or 0)
+                if floor is not None and created < floor:
+                    reached = True
+                    break
+                if id in seen:
+                    # jobs created while paging shift later pages
+                    continue
+                seen.add(id)
+                state = (created, job.get('updateTime'), job.get('status'))
+                if job.get('status') not in self.terminal:
+                    active[id] = state
+                known = self._active.get(id)
+                if known is not None:
+                    if known != state:
+                        changed.append(job)
+                elif (self.high_water is None or created > self.high_water
+                      or (created == self.high_water
+                          and id not in self._newest)):
+                    changed.append(job)
+                if high_water is None or created > high_water:
+                    high_water = created
+                    newest = set([id])
+                elif created == high_water:
+                    newest.add(id)
+            if reached or len(jobs) < self.page_size:
+                break
+            offset += len(jobs)
+
+        # unfinished jobs that weren't seen have been deleted
+        self._active = active
+        self.high_water = high_water
+        self._newest = newest
+        return changed
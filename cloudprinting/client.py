@@ -1,143 +1,957 @@
 # coding: utf-8
+from concurrent.futures import Future
+from copy import deepcopy
+from functools import wraps
+from io import BytesIO
 import json
 import mimetypes
 from os.path import basename
+import threading
+from time import sleep, time
 import requests
+from requests.adapters import HTTPAdapter
+from .batch import Batch
+from .compat import text_type
+from .compression import CompressionStats, compressible, gzip_chunks
+from .multipart import MultipartEncoder
+from .records import Job, Printer
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 
 CLOUDPRINT_URL = "https://www.google.com/cloudprint"
+# prefix of the tag that identifies a job submitted with a *dedupe_key*
+DEDUPE_TAG_PREFIX = "cloudprinting-dedupe:"
+# responses larger than this are parsed incrementally, if ijson is available
+STREAM_THRESHOLD = 1024 * 1024
 
 
-def get_job(id, printer=None, **kwargs):
+def _coalescing(method):
+    """
+    Make identical concurrent calls of a read-only method share one request,
+    if the client has *coalesce* enabled.
+    """
+    @wraps(method)
+    def call(self, *args, **kwargs):
+        if self._flights is None:
+            return method(self, *args, **kwargs)
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if leader:
+            try:
+                flight.set_result(method(self, *args, **kwargs))
+            except Exception as e:
+                flight.set_exception(e)
+            finally:
+                with self._flights_lock:
+                    del self._flights[key]
+        return _share(flight.result())
+    return call
+
+
+def _share(result):
+    """
+    Returns a copy of a shared result, so callers can modify it without
+    affecting each other. Records can't be modified, so they aren't copied.
+    """
+    if isinstance(result, (list, dict)):
+        return deepcopy(result)
+    return result
+
+
+class CloudPrintClient(object):
+    """
+    A Google Cloud Print client that reuses connections across calls.
+
+    :param             auth: authentication used when a call doesn't provide
+                             its own ``auth``, e.g. `OAuth2`
+    :param         base_url: root of the API, defaults to `CLOUDPRINT_URL`
+    :type          base_url: string
+    :param pool_connections: number of per-host connection pools to keep
+    :type  pool_connections: int
+    :param     pool_maxsize: maximum number of connections kept open per host
+    :type      pool_maxsize: int
+    :param       keep_alive: keep connections open between calls
+    :type        keep_alive: bool
+    :param          session: an existing `requests.Session` to use
+    :param        job_cache: index jobs from listings so `get_job` can avoid
+                             fetching every job for each lookup
+    :type         job_cache: `JobCache`
+    :param            retry: retry calls that fail transiently
+    :type             retry: `RetryPolicy`
+    :param   document_cache: reuse documents that are submitted repeatedly
+    :type    document_cache: `DocumentCache`
+    :param         compress: ask for compressed responses
+    :type          compress: bool
+    :param compress_uploads: gzip uploads of documents that compress well,
+                             only if the server accepts compressed request
+                             bodies
+    :type  compress_uploads: bool
+    :param  instrumentation: receives the timings and sizes of calls
+    :type   instrumentation: `Instrumentation`
+    :param         coalesce: share one request between identical concurrent
+                             listings
+    :type          coalesce: bool
+
+    The client owns a `requests.Session`, so successive calls reuse an open
+    TCP/TLS connection rather than performing a new handshake each time.
+    Clients are safe to share between threads; *pool_maxsize* should be at
+    least the number of threads making calls at the same time.
+
+    With *compress*, listings are requested with gzip/deflate encoding. With
+    *compress_uploads*, documents that compress well (see
+    `compression.compressible`, e.g. PostScript and plain text, but not PDF)
+    are uploaded with a gzip ``Content-Encoding``. Google Cloud Print doesn't
+    document support for compressed request bodies, so only use it with a
+    server known to accept them. The bytes saved are counted in
+    ``compression_stats``.
+
+    With *instrumentation*, each call reports its duration, status, bytes
+    sent and received and number of retries, along with how long was spent
+    reading the document, encoding and uploading the request and waiting for
+    the server (see `instrument.Instrumentation`).
+
+    With *coalesce*, when threads call `list_jobs`, `list_printers` or
+    `get_printer` with the same arguments while an identical call is in
+    progress, they wait for its result rather than making their own request.
+    Each caller gets its own copy of the jobs and printers; with
+    ``records=True`` the read-only records are shared rather than copied.
+
+    Extra keyword arguments to each method are passed on to `requests`.
+    """
+    def __init__(self, auth=None, base_url=None, pool_connections=10,
+                 pool_maxsize=10, keep_alive=True, session=None,
+                 job_cache=None, retry=None, document_cache=None,
+                 compress=False, instrumentation=None, coalesce=False,
+                 compress_uploads=False):
+        self.auth = auth
+        self.base_url = base_url
+        self.job_cache = job_cache
+        self.retry = retry
+        self.document_cache = document_cache
+        self.instrumentation = instrumentation
+        self._flights = {} if coalesce else None  # call -> `Future`
+        self._flights_lock = threading.Lock()
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_connections,
+                                  pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        self.compress_uploads = compress_uploads
+        self.compression_stats = None
+        if compress or compress_uploads:
+            self.compression_stats = CompressionStats()
+        if compress:
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        self.session.close()
+
+    def _url(self, path):
+        return (self.base_url or CLOUDPRINT_URL) + path
+
+    def _request(self, method, path, idempotent=True, prepare=None,
+                 before_retry=None, **kwargs):
+        """
+        Send a request, retrying according to the client's `RetryPolicy` if
+        it's *idempotent*.
+
+        *prepare* may be a callable returning extra keyword arguments for
+        each attempt, which allows a request body to be rebuilt. If
+        *before_retry* returns anything other than `None`, it's returned
+        instead of making another attempt.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._attempt(method, path, idempotent, prepare,
+                                 before_retry, None, kwargs)
+        name = path.strip("/")
+        tally = {"name": name, "attempts": 0, "sent": 0, "received": 0,
+                 "status": None}
+        started = time()
+        try:
+            r = self._attempt(method, path, idempotent, prepare,
+                              before_retry, tally, kwargs)
+        except Exception as e:
+            instrumentation.call(name, time() - started, tally['status'],
+                                 tally['sent'], tally['received'],
+                                 max(tally['attempts'] - 1, 0), error=e)
+            raise
+        instrumentation.call(name, time() - started, tally['status'],
+                             tally['sent'], tally['received'],
+                             tally['attempts'] - 1)
+        return r
+
+    def _attempt(self, method, path, idempotent, prepare, before_retry,
+                 tally, kwargs):
+        if self.auth is not None:
+            kwargs.setdefault('auth', self.auth)
+        url = self._url(path)
+        policy = self.retry if idempotent else None
+        started = time()
+        attempt = 0
+        while True:
+            attempt += 1
+            if tally is not None:
+                tally['attempts'] = attempt
+            options = dict(kwargs)
+            if prepare is not None:
+                options.update(prepare())
+            if policy is None:
+                return self._send(method, url, options, tally)
+            try:
+                r = self._send(method, url, options, tally)
+            except (requests.ConnectionError, requests.Timeout):
+                delay = policy.delay(attempt, started)
+                if delay is None:
+                    raise
+            else:
+                if not policy.retryable(r):
+                    return r
+                delay = policy.delay(attempt, started, r)
+                if delay is None:
+                    return r
+                # return the connection to the pool while waiting
+                r.close()
+            sleep(delay)
+            if before_retry is not None:
+                result = before_retry()
+                if result is not None:
+                    return result
+
+    def _send(self, method, url, options, tally=None):
+        if tally is None:
+            r = self.session.request(method, url, **options)
+        else:
+            r = self._send_instrumented(method, url, options, tally)
+        stats = self.compression_stats
+        if (stats is not None and not options.get('stream')
+                and r.headers.get('Content-Encoding')):
+            # tell() is the number of bytes read from the connection
+            stats.record_received(len(r.content), r.raw.tell())
+        if tally is not None:
+            tally['status'] = r.status_code
+            if options.get('stream'):
+                tally['received'] += int(r.headers.get('Content-Length') or 0)
+            else:
+                tally['received'] += _received_size(r)
+        return r
+
+    def _send_instrumented(self, method, url, options, tally):
+        """
+        The same as `requests.Session.request`, but reporting how long is
+        spent in each phase of the request.
+        """
+        instrumentation = self.instrumentation
+        name = tally['name']
+        settings = {}
+        for key in ('timeout', 'allow_redirects', 'proxies', 'stream',
+                    'verify', 'cert'):
+            if key in options:
+                settings[key] = options.pop(key)
+        started = time()
+        request = self.session.prepare_request(
+            requests.Request(method, url, **options))
+        settings.update(self.session.merge_environment_settings(
+            request.url, settings.pop('proxies', None) or {},
+            settings.get('stream'), settings.get('verify'),
+            settings.get('cert')))
+        options.update(settings)
+        sending = time()
+        instrumentation.phase(name, "encode", sending - started)
+        tally['sent'] += _body_size(request.body)
+        r = self.session.send(request, **settings)
+        # a streamed body knows when it was sent in full
+        finished = getattr(request.body, 'finished_at', None)
+        responded = sending + r.elapsed.total_seconds()
+        if finished is not None:
+            instrumentation.phase(name, "upload", finished - sending)
+            instrumentation.phase(name, "server", responded - finished)
+        else:
+            instrumentation.phase(name, "transfer", responded - sending)
+        return r
+
+    def get_job(self, id, printer=None, records=False, **kwargs):
+        """
+        Returns the data for a single job.
+
+        :param      id: print job ID
+        :type       id: string
+        :param printer: if known, the printer id
+        :type  printer: string
+        :param records: return a `Job` rather than a `dict`
+        :type  records: bool
+        :returns: `dict` expressing a job, or `None`
+
+        This is a convience method that uses `list_jobs`, as there is no "get
+        job" API for Google Cloud Print. If the client has a `JobCache`, the
+        job is returned from it while it's up-to-date, otherwise all jobs are
+        listed to refresh the cache. Without a cache, jobs are listed a page
+        at a time (see `iter_jobs`) until the job is found.
+        """
+        cache = self.job_cache
+        if cache is not None:
+            job = cache.get(id)
+            if job is not None or cache.listed(printer):
+                return Job.of(job) if records and job is not None else job
+            jobs = self.list_jobs(printer=printer, records=records, **kwargs)
+            if isinstance(jobs, requests.Response):
+                return None
+        else:
+            jobs = self.iter_jobs(printer=printer, records=records, **kwargs)
+        try:
+            for job in jobs:
+                if job['id'] == id:
+                    return job
+        except requests.HTTPError:
+            return None
+
+    def delete_job(self, id, **kwargs):
+        """
+        Delete a print job.
+
+        :param id: job ID
+        :type  id: string
+
+        :returns: API response data as `dict`, or the HTTP response on failure
+        """
+        r = self._request("POST", "/deletejob", data={"jobid": id}, **kwargs)
+        if r.status_code != requests.codes.ok:
+            return r
+        if self.job_cache is not None:
+            self.job_cache.discard(id)
+        return r.json()
+
+    @_coalescing
+    def list_jobs(self, printer=None, status=None, owner=None, q=None,
+                  offset=None, limit=None, sortorder=None, records=False,
+                  **kwargs):
+        """
+        List print jobs.
+
+        :param   printer: filter by a printer id
+        :type    printer: string
+        :param    status: filter by job status, e.g. ``"DONE"``
+        :type     status: string
+        :param     owner: filter by the email address of the job's owner
+        :type      owner: string
+        :param         q: filter by a search query over job titles and tags
+        :type          q: string
+        :param    offset: number of jobs to skip
+        :type     offset: int
+        :param     limit: maximum number of jobs returned
+        :type      limit: int
+        :param sortorder: e.g. ``"CREATE_TIME"`` or ``"CREATE_TIME_DESC"``
+        :type  sortorder: string
+        :param   records: return `Job` records rather than `dict`
+        :type    records: bool
+
+        :returns: API response data as `dict`, or the HTTP response on failure
+
+        Jobs are represented as `list` of `dict`::
+
+            >>> client.list_jobs()['jobs']
+            [...]
+
+        `Job` records use much less memory than `dict`, while still
+        supporting ``job['key']`` access.
+        """
+        filters = {"status": status, "owner": owner, "q": q,
+                   "offset": offset, "limit": limit}
+        params = dict((k, v) for k, v in filters.items() if v is not None)
+        complete = not params
+        if printer is not None:
+            params["printerid"] = printer
+        if sortorder is not None:
+            params["sortorder"] = sortorder
+        r = self._request("GET", "/jobs", params=params, **kwargs)
+        if r.status_code != requests.codes.ok:
+            return r
+        # At the time of writing, the `/jobs` API returns `Content-Type:
+        # text/plain` header
+        jobs = (r.json() if hasattr(r, "json") else json.loads(r.text))['jobs']
+        if self.job_cache is not None:
+            # cached as `dict`, whether or not records are returned
+            self.job_cache.update(jobs, printer, complete=complete)
+        if records:
+            jobs = [Job(job) for job in jobs]
+        return jobs
+
+    def iter_jobs(self, printer=None, page_size=100,
+                  sortorder="CREATE_TIME_DESC", records=False, **kwargs):
+        """
+        Iterate over print jobs, fetching them a page at a time.
+
+        :param   printer: filter by a printer id
+        :type    printer: string
+        :param page_size: number of jobs fetched per request
+        :type  page_size: int
+        :param sortorder: order of the jobs, newest first by default
+        :type  sortorder: string
+        :param   records: yield `Job` records rather than `dict`
+        :type    records: bool
+        :raises: `requests.HTTPError` on failure
+
+        Extra keyword arguments are passed to `list_jobs`, e.g. ``status``.
+
+        Pages are only fetched as they're needed, so stopping early avoids
+        downloading the remaining jobs. If ijson is installed, large pages are
+        parsed as they're downloaded rather than held in memory whole::
+
+            >>> for job in client.iter_jobs():
+            ...     if job['title'] == "Invoice 42":
+            ...         break
+
+        """
+        filters = {}
+        for name in ("status", "owner", "q"):
+            value = kwargs.pop(name, None)
+            if value is not None:
+                filters[name] = value
+        if printer is not None:
+            filters["printerid"] = printer
+        offset = 0
+        previous = set()
+        while True:
+            params = dict(filters, offset=offset, limit=page_size,
+                          sortorder=sortorder)
+            r = self._request("GET", "/jobs", params=params, stream=True,
+                              **kwargs)
+            try:
+                if r.status_code != requests.codes.ok:
+                    r.raise_for_status()
+                    raise requests.HTTPError("Unexpected response.",
+                                             response=r)
+                current = set()
+                count = 0
+                for job in self._iter_items(r, 'jobs'):
+                    if self.job_cache is not None:
+                        self.job_cache.add(job)
+                    if records:
+                        job = Job(job)
+                    count += 1
+                    current.add(job['id'])
+                    # jobs created (or deleted) while paging shift the
+                    # following pages, so skip jobs already yielded
+                    if job['id'] not in previous:
+                        yield job
+            finally:
+                r.close()
+            if count < page_size:
+                return
+            previous = current
+            offset += count
+
+    def _iter_items(self, r, key):
+        """
+        Yield the items of the list *key* in a streamed JSON response.
+        """
+        length = r.headers.get('Content-Length')
+        if ijson is not None and (length is None
+                                  or int(length) > STREAM_THRESHOLD):
+            r.raw.decode_content = True
+            # floats rather than `Decimal`, as `json.loads` returns
+            for item in ijson.items(r.raw, key + '.item', use_float=True):
+                yield item
+        else:
+            for item in json.loads(r.text)[key]:
+                yield item
+
+    @_coalescing
+    def get_printer(self, id, records=False, **kwargs):
+        """
+        Returns the details of a printer, including its capabilities.
+
+        :param      id: printer ID
+        :type       id: string
+        :param records: return a `Printer` rather than a `dict`
+        :type  records: bool
+
+        :returns: `dict` expressing a printer, `None` if there's no such
+                  printer, or the HTTP response on failure
+
+        Capabilities are described in the Cloud Device Description format, see
+        https://developers.google.com/cloud-print/docs/cdd
+        """
+        r = self._request("GET", "/printer",
+                          params={"printerid": id, "use_cdd": "true"},
+                          **kwargs)
+        if r.status_code != requests.codes.ok:
+            return r
+        printers = r.json().get('printers')
+        if not printers:
+            return None
+        return Printer(printers[0]) if records else printers[0]
+
+    @_coalescing
+    def list_printers(self, records=False, **kwargs):
+        """
+        List registered printers.
+
+        :param records: represent printers as `Printer` records rather than
+                        `dict`
+        :type  records: bool
+
+        :returns: API response data as `dict`, or the HTTP response on failure
+
+        Printers are represented as `list` of `dict`::
+
+            >>> client.list_printers()['printers']
+            [...]
+
+        """
+        r = self._request("GET", "/search", **kwargs)
+        if r.status_code != requests.codes.ok:
+            return r
+        result = r.json()
+        if records and result.get('printers'):
+            result['printers'] = [Printer(printer)
+                                  for printer in result['printers']]
+        return result
+
+    def iter_printers(self, records=False, **kwargs):
+        """
+        Iterate over registered printers as they're parsed.
+
+        :param records: yield `Printer` records rather than `dict`
+        :type  records: bool
+        :raises: `requests.HTTPError` on failure
+
+        If ijson is installed, a large listing is parsed as it's downloaded
+        rather than held in memory whole.
+        """
+        r = self._request("GET", "/search", stream=True, **kwargs)
+        try:
+            if r.status_code != requests.codes.ok:
+                r.raise_for_status()
+                raise requests.HTTPError("Unexpected response.", response=r)
+            for printer in self._iter_items(r, 'printers'):
+                yield Printer(printer) if records else printer
+        finally:
+            r.close()
+
+    def submit_job(self, printer, content, title=None, capabilities=None,
+                   tags=None, content_type=None, streaming=False,
+                   dedupe_key=None, **kwargs):
+        """
+        Submit a print job.
+
+        :param       printer: the id of the printer to use
+        :type        printer: string
+        :param       content: what should be printer
+        :type        content: ``(name, file-like)`` pair, path, or URL if
+                              *content_type* is ``"url"``
+        :param  capabilities: capabilities for the printer
+        :type   capabilities: list
+        :param         title: title of the print job, should be unique to
+                              printer
+        :type          title: string
+        :param          tags: job tags
+        :type           tags: list
+        :params content_type: explicit mimetype for content
+        :type   content_type: string
+        :param     streaming: upload *content* as it's read, rather than
+                              reading it into memory first
+        :type      streaming: bool
+        :param    dedupe_key: unique key for the job, which allows the
+                              submission to be retried safely
+        :type     dedupe_key: string
+
+        :returns: API response data as `dict`, or the HTTP response on failure
+
+        The newly created job is represented as a `dict` in ``job``::
+
+            >>> client.submit_job(...)['job']
+            {...}
+
+        Streaming keeps memory use constant regardless of the size of the
+        document, which matters for large documents.
+
+        A submission is only retried (see `RetryPolicy`) if it has a
+        *dedupe_key*. The key is added to the job as a tag, and before each
+        retry the printer's jobs are checked for it, so a job that was
+        created despite the failure isn't submitted again.
+
+        If the client has a `DocumentCache`, documents given by path are
+        read from it, and published documents are submitted by URL.
+
+        See https://developers.google.com/cloud-print/docs/appInterfaces#submit
+        for details.
+        """
+        instrumentation = self.instrumentation
+        started = time()
+        document = None
+        opened = False
+        if content_type == "url":
+            name = content
+            f = None
+        elif isinstance(content, (list, tuple)):
+            name, f = content
+        else:
+            name = basename(content)
+            if self.document_cache is not None:
+                document = self.document_cache.load(content)
+            if document is not None and document.url is not None:
+                content = document.url
+                content_type = "url"
+                f = None
+            elif document is not None and document.content is not None:
+                content_type = content_type or document.content_type
+                f = BytesIO(document.content)
+            else:
+                f = open(content, 'rb')
+                opened = True
+
+        if title is None:
+            title = name
+
+        if capabilities is None:
+            # magic default value
+            capabilities = [{}]
+
+        tags = list(tags or ())
+        if dedupe_key is not None:
+            tags.append(DEDUPE_TAG_PREFIX + dedupe_key)
+
+        data = {"printerid": printer,
+                "title": title,
+                "contentType": content_type or mimetypes.guess_type(name)[0],
+                "capabilities": json.dumps({"capabilities": capabilities})}
+        if tags:
+            data['tag'] = tags
+
+        try:
+            if f is None:
+                data['content'] = content
+
+                def prepare():
+                    return {"data": data}
+                idempotent = dedupe_key is not None
+            elif streaming or (self.compress_uploads
+                               and compressible(data['contentType'])):
+                try:
+                    start = f.tell()
+                except (AttributeError, IOError, OSError):
+                    start = None
+                headers = dict(kwargs.pop('headers', None) or {})
+                compress = (self.compress_uploads
+                            and compressible(data['contentType']))
+
+                def prepare():
+                    if start is not None:
+                        f.seek(start)
+                    body = MultipartEncoder(sorted(data.items()), "content",
+                                            name, f)
+                    headers['Content-Type'] = body.content_type
+                    if compress:
+                        headers['Content-Encoding'] = 'gzip'
+                        chunks = gzip_chunks(body, self.compression_stats)
+                        # unless streaming, send with a Content-Length
+                        return {"headers": headers,
+                                "data": chunks if streaming
+                                else b"".join(chunks)}
+                    return {"headers": headers,
+                            "data": body if body.len is not None
+                            else iter(body)}
+                idempotent = dedupe_key is not None and start is not None
+            else:
+                files = {"content": (name, f.read())}
+                if instrumentation is not None:
+                    instrumentation.phase("submit", "read", time() - started)
+
+                def prepare():
+                    return {"data": data, "files": files}
+                idempotent = dedupe_key is not None
+
+            def before_retry():
+                if dedupe_key is not None:
+                    job = self.find_tagged(printer,
+                                           DEDUPE_TAG_PREFIX + dedupe_key,
+                                           kwargs.get('auth'))
+                    if job is not None:
+                        return {"success": True, "job": job}
+
+            r = self._request("POST", "/submit", idempotent=idempotent,
+                              prepare=prepare, before_retry=before_retry,
+                              **kwargs)
+        finally:
+            if opened:
+                f.close()
+        if isinstance(r, dict):
+            result = r
+        elif r.status_code != requests.codes.ok:
+            return r
+        else:
+            result = r.json()
+        if self.job_cache is not None and result.get('job'):
+            self.job_cache.add(result['job'])
+        return result
+
+    def find_tagged(self, printer, tag, auth=None):
+        """
+        Returns a job on *printer* that has *tag*, or `None`.
+
+        :param printer: the printer id
+        :type  printer: string
+        :param     tag: the tag to look for
+        :type      tag: string
+        :param    auth: authentication, defaults to the client's
+
+        A job submitted with a *dedupe_key* has the tag
+        ``DEDUPE_TAG_PREFIX + dedupe_key``, so this finds out whether a
+        submission whose response was lost succeeded.
+        """
+        kwargs = {} if auth is None else {"auth": auth}
+        jobs = self.list_jobs(printer=printer, **kwargs)
+        if isinstance(jobs, requests.Response):
+            return None
+        for job in jobs:
+            if tag in (job.get('tags') or ()):
+                return job
+
+    def submit_jobs(self, specs, max_workers=8, per_printer_limit=None,
+                    **kwargs):
+        """
+        Submit many print jobs in parallel.
+
+        :param             specs: keyword arguments for `submit_job`, one per
+                                  job
+        :type              specs: iterable of `dict`
+        :param       max_workers: maximum number of jobs submitted at once
+        :type        max_workers: int
+        :param per_printer_limit: maximum number of jobs submitted at once to
+                                  the same printer
+        :type  per_printer_limit: int
+
+        :returns: `Batch`, which yields an `Outcome` for each job as it
+                  finishes
+
+        Extra keyword arguments are passed to every `submit_job` call. All
+        jobs share this client's connection pool, so *pool_maxsize* should be
+        at least *max_workers*::
+
+            >>> batch = client.submit_jobs(
+            ...     {"printer": printer, "content": path} for path in paths)
+            >>> for outcome in batch:
+            ...     if not outcome.ok:
+            ...         print(outcome.item, outcome.error or outcome.result)
+            >>> batch.throughput
+            42.1
+
+        """
+        def submit(spec):
+            options = dict(kwargs)
+            options.update(spec)
+            return self.submit_job(**options)
+
+        return Batch(submit, specs, max_workers=max_workers,
+                     key=lambda spec: spec['printer'],
+                     per_key_limit=per_printer_limit)
+
+    def delete_jobs(self, targets, max_workers=8, printer=None, **kwargs):
+        """
+        Delete many print jobs in parallel.
+
+        :param     targets: job IDs, or a function that's called with each
+                            job (see `job_filter`) and returns `True` if it
+                            should be deleted
+        :type      targets: iterable of strings, or callable
+        :param max_workers: maximum number of jobs deleted at once
+        :type  max_workers: int
+        :param     printer: when selecting jobs with a function, only consider
+                            jobs for this printer id
+        :type      printer: string
+        :raises: `requests.HTTPError` if listing the jobs fails
+
+        :returns: `Batch`, which yields an `Outcome` for each job ID as it's
+                  deleted
+
+        Extra keyword arguments are passed to every `delete_job` call, and to
+        `list_jobs`. When *targets* is a function, the jobs are selected from
+        a single `list_jobs` call before any are deleted. As with
+        `submit_jobs`, *pool_maxsize* should be at least *max_workers*::
+
+            >>> batch = client.delete_jobs(
+            ...     job_filter(status="DONE", older_than=7 * 86400))
+            >>> failed = [o.item for o in batch if not o.ok]
+            >>> batch.completed, batch.throughput
+            (12000, 85.3)
+
+        """
+        if callable(targets):
+            jobs = self.list_jobs(printer=printer, **kwargs)
+            if isinstance(jobs, requests.Response):
+                jobs.raise_for_status()
+                raise requests.HTTPError("Unexpected response.",
+                                         response=jobs)
+            targets = [job['id'] for job in jobs if targets(job)]
+
+        def delete(id):
+            return self.delete_job(id, **kwargs)
+
+        return Batch(delete, targets, max_workers=max_workers)
+
+
+def job_filter(status=None, older_than=None):
+    """
+    Returns a function that selects jobs for `CloudPrintClient.delete_jobs`.
+
+    :param     status: only select jobs with this status, e.g. ``"DONE"``
+    :type      status: string, or collection of strings
+    :param older_than: only select jobs created more than this many seconds
+                       ago, jobs without a creation time are never selected
+    :type  older_than: float
+    """
+    if isinstance(status, (bytes, text_type)):
+        status = (status,)
+    statuses = frozenset(status) if status is not None else None
+    created_before = (None if older_than is None
+                      else (time() - older_than) * 1000)
+
+    def select(job):
+        if statuses is not None and job.get('status') not in statuses:
+            return False
+        if created_before is not None and not (
+                job.get('createTime')
+                and float(job['createTime']) < created_before):
+            return False
+        return True
+    return select
+
+
+def _body_size(body):
+    """
+    Returns the size of a request body, or ``0`` if it's unknown.
+    """
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, text_type)):
+        return len(body)
+    return getattr(body, 'len', None) or 0
+
+
+def _received_size(r):
+    """
+    Returns the number of bytes of *r*'s body read from the connection.
+    """
+    try:
+        return r.raw.tell()
+    except (AttributeError, IOError, OSError):
+        return len(r.content)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    """
+    Returns the `CloudPrintClient` shared by the module-level functions.
     """
-    Returns the data for a single job.
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = CloudPrintClient()
+        return _default_client
 
-    :param      id: print job ID
-    :type       id: string
-    :param printer: if known, the printer id
-    :type  printer: string
-    :returns: `dict` expressing a job, or `None`
 
-    This is a convience method that uses `list_jobs`, as there is no "get job"
-    API for Google Cloud Print.
+def get_job(id, printer=None, **kwargs):
     """
-    jobs = list_jobs(printer=printer, **kwargs)
-    for job in jobs:
-        if job['id'] == id:
-            return job
+    Returns the data for a single job, see `CloudPrintClient.get_job`.
+    """
+    return default_client().get_job(id, printer=printer, **kwargs)
 
 
 def delete_job(id, **kwargs):
     """
-    Delete a print job.
+    Delete a print job, see `CloudPrintClient.delete_job`.
+    """
+    return default_client().delete_job(id, **kwargs)
 
-    :param id: job ID
-    :type  id: string
 
-    :returns: API response data as `dict`, or the HTTP response on failure
+def delete_jobs(targets, max_workers=8, printer=None, **kwargs):
+    """
+    Delete many print jobs in parallel, see `CloudPrintClient.delete_jobs`.
     """
-    url = CLOUDPRINT_URL + "/deletejob"
-    r = requests.post(url, data={"jobid": id}, **kwargs)
-    return r.json() if r.status_code == requests.codes.ok else r
+    return default_client().delete_jobs(targets, max_workers=max_workers,
+                                        printer=printer, **kwargs)
 
 
 def list_jobs(printer=None, **kwargs):
     """
-    List print jobs.
-
-    :param printer: filter by a printer id
-    :type  printer: string
+    List print jobs, see `CloudPrintClient.list_jobs`.
+    """
+    return default_client().list_jobs(printer=printer, **kwargs)
 
-    :returns: API response data as `dict`, or the HTTP response on failure
 
-    Jobs are represented as `list` of `dict`::
+def iter_jobs(printer=None, page_size=100, **kwargs):
+    """
+    Iterate over print jobs, see `CloudPrintClient.iter_jobs`.
+    """
+    return default_client().iter_jobs(printer=printer, page_size=page_size,
+                                      **kwargs)
 
-        >>> list_jobs(auth=...)['jobs']
-        [...]
 
+def get_printer(id, **kwargs):
     """
-    params = {}
-    if printer is not None:
-        params["printerid"] = printer
-    url = CLOUDPRINT_URL + "/jobs"
-    r = requests.get(url, params=params, **kwargs)
-    if r.status_code != requests.codes.ok:
-        return r
-    # At the time of writing, the `/jobs` API returns `Content-Type:
-    # text/plain` header
-    return (r.json() if hasattr(r, "json") else json.loads(r.text))['jobs']
+    Returns the details of a printer, see `CloudPrintClient.get_printer`.
+    """
+    return default_client().get_printer(id, **kwargs)
 
 
 def list_printers(**kwargs):
     """
-    List registered printers.
+    List registered printers, see `CloudPrintClient.list_printers`.
+    """
+    return default_client().list_printers(**kwargs)
 
-    :returns: API response data as `dict`, or the HTTP response on failure
 
-    Printers are represented as `list` of `dict`::
+def iter_printers(**kwargs):
+    """
+    Iterate over registered printers, see `CloudPrintClient.iter_printers`.
+    """
+    return default_client().iter_printers(**kwargs)
 
-        >>> list_printers(auth=...)['printers']
-        [...]
 
+def submit_job(printer, content, title=None, capabilities=None, tags=None,
+               content_type=None, streaming=False, dedupe_key=None, **kwargs):
     """
-    url = CLOUDPRINT_URL + "/search"
-    r = requests.get(url, **kwargs)
-    if r.status_code != requests.codes.ok:
-        return r
-    return r.json()
+    Submit a print job, see `CloudPrintClient.submit_job`.
+    """
+    return default_client().submit_job(printer, content, title=title,
+                                       capabilities=capabilities, tags=tags,
+                                       content_type=content_type,
+                                       streaming=streaming,
+                                       dedupe_key=dedupe_key, **kwargs)
 
 
-def submit_job(printer, content, title=None, capabilities=None, tags=None,
-               content_type=None, **kwargs):
-    """
-    Submit a print job.
-
-    :param       printer: the id of the printer to use
-    :type        printer: string
-    :param       content: what should be printer
-    :type        content: ``(name, file-like)`` pair or path
-    :param  capabilities: capabilities for the printer
-    :type   capabilities: list
-    :param         title: title of the print job, should be unique to printer
-    :type          title: string
-    :param          tags: job tags
-    :type           tags: list
-    :params content_type: explicit mimetype for content
-    :type   content_type: string
-
-    :returns: API response data as `dict`, or the HTTP response on failure
-
-    The newly created job is represented as a `dict` in ``job``::
-
-        >>> submit_job(...)['job']
-        {...}
-
-    See https://developers.google.com/cloud-print/docs/appInterfaces#submit for
-    details.
-    """
-    # normalise *content* to bytes, and *name* to a string
-    if isinstance(content, (list, tuple)):
-        name = content[0]
-        content = content[1].read()
-    else:
-        name = basename(content)
-        with open(content, 'rb') as f:
-            content = f.read()
-
-    if title is None:
-        title = name
-
-    if capabilities is None:
-        # magic default value
-        capabilities = [{}]
-
-    files = {"content": (name, content)}
-    data = {"printerid": printer,
-            "title": title,
-            "contentType": content_type or mimetypes.guess_type(name)[0],
-            "capabilities": json.dumps({"capabilities": capabilities})}
-    if tags:
-        data['tag'] = tags
-    url = CLOUDPRINT_URL + "/submit"
-    r = requests.post(url, data=data, files=files, **kwargs)
-    return r.json() if r.status_code == requests.codes.ok else r
+def submit_jobs(specs, max_workers=8, per_printer_limit=None, **kwargs):
+    """
+    Submit many print jobs in parallel, see `CloudPrintClient.submit_jobs`.
+    """
+    return default_client().submit_jobs(specs, max_workers=max_workers,
+                                        per_printer_limit=per_printer_limit,
+                                        **kwargs)
@@ -0,0 +1,8 @@
+# coding: utf-8
+"""
+Names that differ between Python 2 and 3.
+"""
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
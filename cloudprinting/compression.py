@@ -0,0 +1,84 @@
+# coding: utf-8
+"""
+Compression of request and response bodies.
+"""
+import threading
+import zlib
+
+
+# documents of these types compress well, any other type (e.g. PDF, images
+# and archives) is likely to be compressed already, and is sent as it is
+COMPRESSIBLE_TYPES = frozenset([
+    "application/json",
+    "application/postscript",
+    "application/rtf",
+    "application/xml",
+    "image/pwg-raster",
+])
+COMPRESSIBLE_PREFIXES = ("text/",)
+COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+
+def compressible(content_type):
+    """
+    `True` if a document of *content_type* is worth compressing, e.g.
+    PostScript and plain text, but not PDF or images.
+    """
+    if not content_type or content_type == "url":
+        return False
+    content_type = content_type.split(";")[0].strip().lower()
+    return (content_type in COMPRESSIBLE_TYPES
+            or content_type.startswith(COMPRESSIBLE_PREFIXES)
+            or content_type.endswith(COMPRESSIBLE_SUFFIXES))
+
+
+class CompressionStats(object):
+    """
+    Counts bytes before and after compression.
+
+    :ivar      sent: bytes of request bodies sent
+    :ivar  sent_raw: bytes of those bodies before compression
+    :ivar  received: bytes of response bodies received
+    :ivar received_raw: bytes of those bodies after decompression
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = self.sent_raw = 0
+        self.received = self.received_raw = 0
+
+    @property
+    def saved(self):
+        """
+        Total bytes not transferred thanks to compression.
+        """
+        return (self.sent_raw - self.sent) + (self.received_raw
+                                              - self.received)
+
+    def record_sent(self, raw, compressed):
+        with self.lock:
+            self.sent_raw += raw
+            self.sent += compressed
+
+    def record_received(self, raw, compressed):
+        with self.lock:
+            self.received_raw += raw
+            self.received += compressed
+
+
+def gzip_chunks(chunks, stats=None, level=6):
+    """
+    Yield gzip compressed *chunks*, recording the sizes in *stats*.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    raw = compressed = 0
+    for chunk in chunks:
+        raw += len(chunk)
+        chunk = compressor.compress(chunk)
+        if chunk:
+            compressed += len(chunk)
+            yield chunk
+    chunk = compressor.flush()
+    compressed += len(chunk)
+    if stats is not None:
+        stats.record_sent(raw, compressed)
+    yield chunk
@@ -0,0 +1,227 @@
+# coding: utf-8
+import threading
+from time import time
+import requests
+from .client import default_client
+
+
+def capabilities(printer):
+    """
+    Returns the indexed capabilities of a printer, from its Cloud Device
+    Description, as a `set` of ``(name, value)`` pairs:
+
+    - ``("duplex", bool)``
+    - ``("color", bool)``
+    - ``("media_size", name)``, e.g. ``("media_size", "ISO_A4")``
+    """
+    description = (printer.get('capabilities') or {})
+    if not isinstance(description, dict):
+        return set()
+    description = description.get('printer') or {}
+
+    def options(name):
+        return (description.get(name) or {}).get('option') or []
+
+    found = set()
+    if 'duplex' in description:
+        found.add(("duplex", any(option.get('type', 'NO_DUPLEX')
+                                 != 'NO_DUPLEX'
+                                 for option in options('duplex'))))
+    if 'color' in description:
+        found.add(("color", any(option.get('type') in ('STANDARD_COLOR',
+                                                       'CUSTOM_COLOR')
+                                for option in options('color'))))
+    for option in options('media_size'):
+        if option.get('name'):
+            found.add(("media_size", option['name']))
+    return found
+
+
+class _Index(object):
+    """
+    An immutable snapshot of the directory, replaced as a whole on refresh so
+    lookups don't need to lock.
+    """
+    def __init__(self, printers, fetched_at):
+        self.fetched_at = fetched_at
+        self.by_id = {}
+        self.by_name = {}
+        self.by_proxy = {}
+        self.by_capability = {}
+        for printer in printers:
+            id = printer['id']
+            self.by_id[id] = printer
+            for name in set([printer.get('name'),
+                             printer.get('displayName')]):
+                if name:
+                    self.by_name.setdefault(name, []).append(printer)
+            if printer.get('proxy'):
+                self.by_proxy.setdefault(printer['proxy'], []).append(printer)
+            for capability in capabilities(printer):
+                self.by_capability.setdefault(capability, set()).add(id)
+
+
+class PrinterDirectory(object):
+    """
+    A cache of registered printers, indexed by ID, name, proxy and
+    capability.
+
+    :param       client: client used to list printers, defaults to the client
+                         used by the module-level functions
+    :type        client: `CloudPrintClient`
+    :param          ttl: seconds before the directory is refreshed
+    :type           ttl: float
+    :param capabilities: fetch the capabilities of each printer, so printers
+                         can be found by capability
+    :type  capabilities: bool
+
+    Extra keyword arguments are passed to `list_printers` and `get_printer`,
+    e.g. ``auth``.
+
+    A lookup refreshes the directory if it's older than *ttl*, while other
+    lookups meanwhile use the previous printers; `start` instead refreshes it
+    in a background thread, so lookups never wait. Capabilities
+    are only fetched for printers that are new or have been updated since the
+    last refresh. If a refresh fails, the previous printers are kept::
+
+        >>> directory = PrinterDirectory(auth=auth)
+        >>> directory.by_name("Front Office")[0]['id']
+        '0e506d12-dbe0-54d3-7392-fd69d45ff2fc'
+        >>> [p['name'] for p in directory.find(duplex=True,
+        ...                                    media_size="ISO_A4")]
+        ['Front Office', 'Warehouse']
+
+    """
+    def __init__(self, client=None, ttl=300, capabilities=True, **kwargs):
+        self.client = client
+        self.ttl = ttl
+        self.capabilities = capabilities
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self._index = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def refresh(self):
+        """
+        Fetch the printers now.
+
+        :returns: `True` if the directory was refreshed
+        """
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self):
+        client = self.client or default_client()
+        r = client.list_printers(**self.kwargs)
+        if isinstance(r, requests.Response):
+            return False
+        previous = self._index.by_id if self._index else {}
+        printers = []
+        for printer in r['printers']:
+            if self.capabilities:
+                known = previous.get(printer['id'])
+                if (known is not None and 'capabilities' in known
+                        and known.get('updateTime')
+                        == printer.get('updateTime')):
+                    printer = dict(printer,
+                                   capabilities=known['capabilities'])
+                else:
+                    details = client.get_printer(printer['id'],
+                                                 **self.kwargs)
+                    if isinstance(details, dict):
+                        printer = dict(printer, capabilities=details.get(
+                            'capabilities'))
+            printers.append(printer)
+        self._index = _Index(printers, time())
+        return True
+
+    def _stale(self, index):
+        return index is None or (self._thread is None
+                                 and time() - index.fetched_at >= self.ttl)
+
+    @property
+    def index(self):
+        index = self._index
+        if self._stale(index):
+            # while another thread refreshes, serve the previous snapshot
+            # rather than waiting, or fetching the printers again
+            if self.lock.acquire(index is None):
+                try:
+                    if self._stale(self._index):
+                        self._refresh()
+                finally:
+                    self.lock.release()
+                index = self._index
+        if index is None:
+            raise RuntimeError("Unable to list printers.")
+        return index
+
+    def __iter__(self):
+        return iter(list(self.index.by_id.values()))
+
+    def __len__(self):
+        return len(self.index.by_id)
+
+    def get(self, id):
+        """
+        Returns the printer with *id*, or `None`.
+        """
+        return self.index.by_id.get(id)
+
+    def by_name(self, name):
+        """
+        Returns a `list` of printers with *name* (or display name).
+        """
+        return list(self.index.by_name.get(name, ()))
+
+    def by_proxy(self, proxy):
+        """
+        Returns a `list` of printers connected through *proxy*.
+        """
+        return list(self.index.by_proxy.get(proxy, ()))
+
+    def find(self, **required):
+        """
+        Returns a `list` of printers with all of the *required* capabilities,
+        e.g. ``find(duplex=True, color=True, media_size="ISO_A4")``.
+        """
+        index = self.index
+        ids = None
+        for capability in required.items():
+            matches = index.by_capability.get(capability, set())
+            ids = matches if ids is None else ids & matches
+        if ids is None:
+            return list(index.by_id.values())
+        return [index.by_id[id] for id in ids]
+
+    def start(self, interval=None):
+        """
+        Refresh in a background thread every *interval* seconds (default:
+        ``ttl``).
+        """
+        if self._thread is not None:
+            return
+        interval = interval or self.ttl
+        self._stopping.clear()
+
+        def run():
+            while not self._stopping.is_set():
+                try:
+                    self.refresh()
+                except requests.RequestException:
+                    pass
+                self._stopping.wait(interval)
+
+        self._thread = threading.Thread(target=run, name="PrinterDirectory")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread started by `start`.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
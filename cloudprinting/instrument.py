@@ -0,0 +1,212 @@
+# coding: utf-8
+"""
+Instrumentation of API calls and token refreshes.
+
+Pass an `Instrumentation` to `CloudPrintClient` (and `OAuth2`) to receive
+events. When no instrumentation is given, no timings are taken at all.
+"""
+import logging
+import threading
+
+
+class Instrumentation(object):
+    """
+    Receives events; subclasses override the events they're interested in.
+
+    Calls are named after the API they use, e.g. ``"submit"``, ``"jobs"``,
+    ``"search"``, ``"printer"`` and ``"deletejob"``.
+    """
+    def call(self, name, elapsed, status, bytes_sent, bytes_received,
+             retries, error=None):
+        """
+        An API call finished.
+
+        :param           name: the API called
+        :param        elapsed: seconds taken, including retries
+        :param         status: HTTP status of the final response, or `None`
+        :param     bytes_sent: bytes of request bodies sent, if known
+        :param bytes_received: bytes of response bodies received
+        :param        retries: number of attempts after the first
+        :param          error: the exception raised, if any
+        """
+
+    def phase(self, name, phase, elapsed):
+        """
+        A phase of an API call finished.
+
+        Phases are ``"read"`` (reading the document), ``"encode"`` (preparing
+        the request), and ``"upload"`` and ``"server"`` (sending the body,
+        then waiting for the response) for streamed bodies, or ``"transfer"``
+        (both) otherwise.
+        """
+
+    def token_refresh(self, elapsed, source, error=None):
+        """
+        An `OAuth2` token was refreshed.
+
+        :param elapsed: seconds taken
+        :param  source: ``"endpoint"``, or ``"store"`` if a token refreshed by
+                        another instance was used
+        :param   error: the exception raised, if any
+        """
+
+
+class LoggingInstrumentation(Instrumentation):
+    """
+    Logs events with the `logging` module.
+
+    :param logger: defaults to the ``cloudprinting`` logger
+    :param  level: level of the messages
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger("cloudprinting")
+        self.level = level
+
+    def call(self, name, elapsed, status, bytes_sent, bytes_received,
+             retries, error=None):
+        self.logger.log(self.level, "%s: status=%s elapsed=%.3fs sent=%d "
+                        "received=%d retries=%d%s", name, status, elapsed,
+                        bytes_sent, bytes_received, retries,
+                        " error=%r" % error if error is not None else "")
+
+    def phase(self, name, phase, elapsed):
+        self.logger.log(self.level, "%s: %s took %.3fs", name, phase,
+                        elapsed)
+
+    def token_refresh(self, elapsed, source, error=None):
+        self.logger.log(self.level, "OAuth2 token refresh from %s: "
+                        "elapsed=%.3fs%s", source, elapsed,
+                        " error=%r" % error if error is not None else "")
+
+
+class _Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace('"', '\\"'))
+                             for key, value in labels)
+
+
+class MetricsRegistry(Instrumentation):
+    """
+    Aggregates events as Prometheus-style metrics in memory.
+
+    :param buckets: upper bounds of the duration histogram buckets, in
+                    seconds
+
+    `render` returns the metrics in the Prometheus text exposition format,
+    for serving from a ``/metrics`` endpoint::
+
+        >>> metrics = MetricsRegistry()
+        >>> client = CloudPrintClient(auth=auth, instrumentation=metrics)
+        >>> print(metrics.render())
+        # TYPE cloudprinting_calls_total counter
+        cloudprinting_calls_total{call="search",status="200"} 1
+        ...
+
+    """
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+               60)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}  # (metric, labels) -> value
+        self.histograms = {}  # (metric, labels) -> _Histogram
+
+    def _count(self, metric, labels, value=1):
+        key = (metric, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, metric, labels, value):
+        histogram = self.histograms.get((metric, labels))
+        if histogram is None:
+            histogram = _Histogram(self.buckets)
+            self.histograms[(metric, labels)] = histogram
+        histogram.observe(value)
+
+    def call(self, name, elapsed, status, bytes_sent, bytes_received,
+             retries, error=None):
+        labels = (("call", name),)
+        with self.lock:
+            self._count("cloudprinting_calls_total", labels + (
+                ("status", "error" if error is not None else str(status)),))
+            self._observe("cloudprinting_call_duration_seconds", labels,
+                          elapsed)
+            self._count("cloudprinting_sent_bytes_total", labels,
+                        bytes_sent)
+            self._count("cloudprinting_received_bytes_total", labels,
+                        bytes_received)
+            self._count("cloudprinting_retries_total", labels, retries)
+
+    def phase(self, name, phase, elapsed):
+        with self.lock:
+            self._observe("cloudprinting_phase_duration_seconds",
+                          (("call", name), ("phase", phase)), elapsed)
+
+    def token_refresh(self, elapsed, source, error=None):
+        with self.lock:
+            self._count("cloudprinting_token_refreshes_total", (
+                ("source", source),
+                ("outcome", "error" if error is not None else "success")))
+            self._observe("cloudprinting_token_refresh_duration_seconds", (),
+                          elapsed)
+
+    def value(self, metric, **labels):
+        """
+        Returns the value of a counter, or the count of a histogram.
+        """
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            for (name, found), value in self.counters.items():
+                if name == metric and tuple(sorted(found)) == key[1]:
+                    return value
+            for (name, found), histogram in self.histograms.items():
+                if name == metric and tuple(sorted(found)) == key[1]:
+                    return histogram.count
+        return 0
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            typed = set()
+            for (metric, labels), value in sorted(
+                    self.counters.items(), key=lambda item: item[0]):
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append("# TYPE %s counter" % metric)
+                lines.append("%s%s %s" % (metric, _labels(labels), value))
+            for (metric, labels), histogram in sorted(
+                    self.histograms.items(), key=lambda item: item[0]):
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append("# TYPE %s histogram" % metric)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append("%s_bucket%s %d" % (
+                        metric, _labels(labels + (("le", bound),)), count))
+                lines.append("%s_bucket%s %d" % (
+                    metric, _labels(labels + (("le", "+Inf"),)),
+                    histogram.count))
+                lines.append("%s_sum%s %s" % (metric, _labels(labels),
+                                              histogram.sum))
+                lines.append("%s_count%s %d" % (metric, _labels(labels),
+                                                histogram.count))
+        return "\n".join(lines) + "\n"
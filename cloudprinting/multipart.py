@@ -0,0 +1,136 @@
+# coding: utf-8
+"""
+Incremental ``multipart/form-data`` encoding, so documents can be uploaded
+without reading them into memory.
+"""
+import os
+from time import time
+from uuid import uuid4
+from .compat import text_type
+
+
+CRLF = b"\r\n"
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, text_type):
+        value = text_type(value)
+    return value.encode("utf-8")
+
+
+def _remaining(fileobj):
+    """
+    Returns the number of bytes left to read in *fileobj*, or `None` if it
+    can't be determined without reading it.
+    """
+    try:
+        position = fileobj.tell()
+    except (AttributeError, IOError, OSError):
+        return None
+    try:
+        return os.fstat(fileobj.fileno()).st_size - position
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+    try:
+        fileobj.seek(0, os.SEEK_END)
+        end = fileobj.tell()
+        fileobj.seek(position)
+    except (AttributeError, IOError, OSError):
+        return None
+    return end - position
+
+
+class MultipartEncoder(object):
+    """
+    A ``multipart/form-data`` request body that's produced as it's read.
+
+    :param     fields: form fields, values may be a `list` to repeat a field
+    :type      fields: list of ``(name, value)`` pairs
+    :param       name: form field name of the file
+    :type        name: string
+    :param   filename: name of the file sent to the server
+    :type    filename: string
+    :param    fileobj: file-like object to read the content from
+    :param chunk_size: maximum bytes read from *fileobj* at once
+    :type  chunk_size: int
+
+    At most *chunk_size* bytes of the file are held in memory at any time. If
+    the size of *fileobj* can be determined, ``len`` holds the size of the
+    whole body so it can be sent with a ``Content-Length``; otherwise it's
+    `None` and the body should be sent chunked by iterating the encoder.
+    Once the whole body has been read, ``finished_at`` holds the time.
+    """
+    def __init__(self, fields, name, filename, fileobj, chunk_size=65536):
+        self.boundary = uuid4().hex
+        self.content_type = "multipart/form-data; boundary=%s" % self.boundary
+        self.chunk_size = chunk_size
+        self.fileobj = fileobj
+
+        boundary = b"--" + _to_bytes(self.boundary)
+        head = []
+        for key, values in fields:
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for value in values:
+                if value is None:
+                    continue
+                head.extend([
+                    boundary,
+                    b'Content-Disposition: form-data; name="'
+                    + _to_bytes(key) + b'"',
+                    b"",
+                    _to_bytes(value)])
+        head.extend([
+            boundary,
+            b'Content-Disposition: form-data; name="' + _to_bytes(name)
+            + b'"; filename="' + _to_bytes(filename).replace(b'"', b'\\"')
+            + b'"',
+            b"Content-Type: application/octet-stream",
+            b"", b""])
+        self._head = CRLF.join(head)
+        self._tail = CRLF + boundary + b"--" + CRLF
+
+        remaining = _remaining(fileobj)
+        self.len = (None if remaining is None
+                    else len(self._head) + remaining + len(self._tail))
+        self._parts = self._generate()
+        self._buffer = b""
+        self.finished_at = None
+
+    def _generate(self):
+        yield self._head
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        self.finished_at = time()
+        yield self._tail
+
+    def __iter__(self):
+        if self._buffer:
+            buffered, self._buffer = self._buffer, b""
+            yield buffered
+        for part in self._parts:
+            yield part
+
+    def read(self, size=-1):
+        """
+        Read up to *size* bytes of the body.
+        """
+        if size is None or size < 0:
+            return b"".join(self)
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while length < size:
+            try:
+                part = next(self._parts)
+            except StopIteration:
+                break
+            chunks.append(part)
+            length += len(part)
+        data = b"".join(chunks)
+        self._buffer = data[size:]
+        return data[:size]
@@ -0,0 +1,296 @@
+# coding: utf-8
+"""
+Clients for many Google accounts, each with its own connections and token.
+"""
+import threading
+from time import time
+import requests
+from .auth import OAuth2
+from .client import CloudPrintClient
+
+
+class Account(object):
+    """
+    An account in an `AccountPool`.
+
+    :ivar         key: the key calls are routed by
+    :ivar        auth: the account's `OAuth2`
+    :ivar      client: the account's `CloudPrintClient`
+    :ivar       calls: number of calls finished
+    :ivar    failures: number of calls that failed
+    :ivar   in_flight: number of calls in progress
+    :ivar     elapsed: total seconds spent in calls
+    :ivar  last_error: the last failure, an exception or HTTP response
+    """
+    def __init__(self, key, auth, client, max_concurrency):
+        self.key = key
+        self.auth = auth
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.elapsed = 0.0
+        self.last_error = None
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a method of the client, waiting while the account has
+        *max_concurrency* calls in progress.
+        """
+        with self.semaphore:
+            with self.lock:
+                self.in_flight += 1
+            started = time()
+            result = error = None
+            try:
+                result = getattr(self.client, method)(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                failed = (error is not None
+                          or isinstance(result, requests.Response)
+                          or (isinstance(result, dict)
+                              and not result.get('success', True)))
+                with self.lock:
+                    self.in_flight -= 1
+                    self.calls += 1
+                    self.elapsed += time() - started
+                    if failed:
+                        self.failures += 1
+                        self.last_error = error or result
+
+    def stats(self):
+        """
+        Returns a `dict` of the account's counters.
+        """
+        with self.lock:
+            return {"calls": self.calls,
+                    "failures": self.failures,
+                    "in_flight": self.in_flight,
+                    "elapsed": self.elapsed,
+                    "max_concurrency": self.max_concurrency,
+                    "token_expires_at": self.auth.expires_at}
+
+
+class AccountPool(object):
+    """
+    Routes calls to the client of one of many accounts, by key.
+
+    :param max_concurrency: default maximum number of calls in progress for
+                            each account
+    :type  max_concurrency: int
+    :param    auto_refresh: refresh tokens in a background thread before they
+                            expire
+    :type     auto_refresh: bool
+    :param           store: shares tokens with other processes, see
+                            `cloudprinting.tokens`
+    :type            store: `TokenStore`
+
+    Extra keyword arguments are passed to each account's `CloudPrintClient`,
+    e.g. ``retry``.
+
+    Each account has its own `CloudPrintClient`, so connections and tokens
+    are never shared between accounts, and calls for one account don't wait
+    for another's. A single thread refreshes every account's token shortly
+    before it expires, so one process can serve hundreds of accounts::
+
+        >>> pool = AccountPool(max_concurrency=4)
+        >>> pool.add("north", refresh_token=..., client_id=...,
+        ...          client_secret=...)
+        >>> pool.add("south", refresh_token=..., client_id=...,
+        ...          client_secret=...)
+        >>> pool.submit_job("south", printer, "test.pdf")
+        {"success": True, "job": {...}}
+        >>> pool.stats()['south']['calls']
+        1
+
+    """
+    max_refresh_interval = 60
+    retry_interval = 10
+
+    def __init__(self, max_concurrency=8, auto_refresh=True, store=None,
+                 **kwargs):
+        self.max_concurrency = max_concurrency
+        self.auto_refresh = auto_refresh
+        self.store = store
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self._accounts = {}
+        self._refresher = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, key):
+        return key in self._accounts
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __getitem__(self, key):
+        """
+        Returns the `Account` for *key*, or raises `KeyError`.
+        """
+        return self._accounts[key]
+
+    def keys(self):
+        return list(self._accounts)
+
+    def add(self, key, auth=None, max_concurrency=None, **credentials):
+        """
+        Add an account.
+
+        :param             key: the key calls for the account are routed by
+        :param            auth: the account's authentication, or else it's
+                                created from *credentials*
+        :type             auth: `OAuth2`
+        :param max_concurrency: maximum number of calls in progress for the
+                                account, defaults to the pool's
+        :type  max_concurrency: int
+
+        *credentials* are passed to `OAuth2`, e.g. ``refresh_token``,
+        ``client_id`` and ``client_secret``.
+
+        :returns: the `Account`
+        """
+        if key in self._accounts:
+            raise ValueError("account %r is already in the pool" % (key,))
+        if auth is None:
+            credentials.setdefault('store', self.store)
+            auth = OAuth2(**credentials)
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency
+        options = dict(self.kwargs)
+        options.setdefault('pool_connections', 1)
+        options.setdefault('pool_maxsize', max_concurrency)
+        client = CloudPrintClient(auth=auth, **options)
+        account = Account(key, auth, client, max_concurrency)
+        with self.lock:
+            self._accounts[key] = account
+            if self.auto_refresh and auth.refreshable:
+                self._start_refresher()
+        self._wakeup.set()
+        return account
+
+    def remove(self, key):
+        """
+        Remove an account, and close its connections.
+        """
+        with self.lock:
+            account = self._accounts.pop(key)
+        account.client.close()
+
+    def call(self, key, method, *args, **kwargs):
+        """
+        Call a `CloudPrintClient` method for the account *key*.
+        """
+        return self._accounts[key].call(method, *args, **kwargs)
+
+    def submit_job(self, key, printer, content, **kwargs):
+        """
+        Submit a print job for an account, see `CloudPrintClient.submit_job`.
+        """
+        return self.call(key, "submit_job", printer, content, **kwargs)
+
+    def get_job(self, key, id, printer=None, **kwargs):
+        """
+        Returns the data for a single job of an account, see
+        `CloudPrintClient.get_job`.
+        """
+        return self.call(key, "get_job", id, printer=printer, **kwargs)
+
+    def delete_job(self, key, id, **kwargs):
+        """
+        Delete a print job of an account, see `CloudPrintClient.delete_job`.
+        """
+        return self.call(key, "delete_job", id, **kwargs)
+
+    def list_jobs(self, key, printer=None, **kwargs):
+        """
+        List an account's print jobs, see `CloudPrintClient.list_jobs`.
+        """
+        return self.call(key, "list_jobs", printer=printer, **kwargs)
+
+    def get_printer(self, key, id, **kwargs):
+        """
+        Returns the details of an account's printer, see
+        `CloudPrintClient.get_printer`.
+        """
+        return self.call(key, "get_printer", id, **kwargs)
+
+    def list_printers(self, key, **kwargs):
+        """
+        List an account's printers, see `CloudPrintClient.list_printers`.
+        """
+        return self.call(key, "list_printers", **kwargs)
+
+    def stats(self):
+        """
+        Returns a `dict` of each account's counters (see `Account.stats`),
+        by key.
+        """
+        with self.lock:
+            accounts = list(self._accounts.values())
+        return dict((account.key, account.stats()) for account in accounts)
+
+    def refresh(self):
+        """
+        Refresh the tokens that are about to expire.
+
+        :returns: seconds until the next token needs refreshing
+        """
+        with self.lock:
+            accounts = list(self._accounts.values())
+        wait = self.max_refresh_interval
+        for account in accounts:
+            auth = account.auth
+            if not auth.refreshable:
+                continue
+            if auth.expired:
+                try:
+                    auth.refresh()
+                except Exception:
+                    # requests refresh the token themselves if this fails
+                    wait = min(wait, self.retry_interval)
+                    continue
+            if auth.expires_at is not None:
+                wait = min(wait, auth.expires_at - auth.refresh_margin
+                           - time())
+        return max(wait, 1)
+
+    def _refresh_loop(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            self._wakeup.wait(self.refresh())
+
+    def _start_refresher(self):
+        if self._refresher is None:
+            self._stopping.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop,
+                                               name="AccountPool-refresh")
+            self._refresher.daemon = True
+            self._refresher.start()
+
+    def close(self):
+        """
+        Stop refreshing tokens, and close every account's connections.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+        with self.lock:
+            accounts = list(self._accounts.values())
+        for account in accounts:
+            account.client.close()
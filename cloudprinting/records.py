@@ -0,0 +1,225 @@
+# coding: utf-8
+"""
+Compact representations of jobs and printers, for holding many in memory.
+"""
+import json
+import sys
+
+try:
+    intern = sys.intern
+except AttributeError:
+    pass
+
+
+def _int(value):
+    return int(value)
+
+
+def _str(value):
+    return "%d" % value
+
+
+def _interned(value):
+    # these values repeat between records, so share a single copy
+    return intern(value) if isinstance(value, str) else value
+
+
+def _tuple(value):
+    return tuple(value)
+
+
+def _list(value):
+    return list(value)
+
+
+def _same(value):
+    return value
+
+
+class Record(object):
+    """
+    Base class for a record of API data, with typed attributes for the
+    commonly used fields.
+
+    Subclasses define ``fields``, a sequence of ``(key, attribute, load,
+    dump)`` tuples, and matching ``__slots__``. The remaining fields are kept
+    as a compact JSON string and decoded when they're accessed.
+
+    Records can be used like the `dict` they replace (``record['key']``,
+    ``get``, ``in``, ``keys``...), and ``dict(record)`` recreates it. They
+    can't be modified, so they're safe to share between threads.
+    """
+    __slots__ = ('_extra',)
+    fields = ()
+
+    def __init__(self, data):
+        known = self._keys()
+        for key, attribute, load, _ in self.fields:
+            value = data.get(key)
+            object.__setattr__(self, attribute,
+                               None if value is None else load(value))
+        extra = dict((k, v) for k, v in data.items() if k not in known)
+        object.__setattr__(self, '_extra',
+                           json.dumps(extra, separators=(',', ':'))
+                           if extra else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is read-only" % type(self).__name__)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @classmethod
+    def _keys(cls):
+        keys = cls.__dict__.get('_key_map')
+        if keys is None:
+            keys = dict((key, (attribute, dump))
+                        for key, attribute, _, dump in cls.fields)
+            cls._key_map = keys
+        return keys
+
+    @classmethod
+    def of(cls, data):
+        """
+        Returns *data* as a record, *data* may already be one.
+        """
+        return data if isinstance(data, cls) else cls(data)
+
+    @property
+    def extra(self):
+        """
+        The rarely used fields, as a `dict`.
+        """
+        return json.loads(self._extra) if self._extra else {}
+
+    def to_dict(self):
+        """
+        Returns the record as the API's `dict` representation.
+        """
+        data = self.extra
+        for key, attribute, _, dump in self.fields:
+            value = getattr(self, attribute)
+            if value is not None:
+                data[key] = dump(value)
+        return data
+
+    def __getitem__(self, key):
+        field = self._keys().get(key)
+        if field is None:
+            return self.extra[key]
+        value = getattr(self, field[0])
+        if value is None:
+            raise KeyError(key)
+        return field[1](value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        field = self._keys().get(key)
+        if field is None:
+            return key in self.extra
+        return getattr(self, field[0]) is not None
+
+    def keys(self):
+        return list(self.to_dict().keys())
+
+    def items(self):
+        return list(self.to_dict().items())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, self.id)
+
+
+class Job(Record):
+    """
+    A print job.
+
+    :ivar              id: job ID
+    :ivar      printer_id: printer ID
+    :ivar           title: title
+    :ivar          status: e.g. ``"QUEUED"`` or ``"DONE"``
+    :ivar     create_time: creation time in milliseconds since the epoch
+    :ivar     update_time: last update time in milliseconds since the epoch
+    :ivar            tags: `tuple` of tags
+    :ivar    content_type: mimetype of the document
+    :ivar        owner_id: email address of the owner
+    :ivar number_of_pages: number of pages
+    :ivar      error_code: error code, if the job failed
+    :ivar         message: status message
+    """
+    __slots__ = ('id', 'printer_id', 'title', 'status', 'create_time',
+                 'update_time', 'tags', 'content_type', 'owner_id',
+                 'number_of_pages', 'error_code', 'message')
+    fields = (
+        ('id', 'id', _same, _same),
+        ('printerid', 'printer_id', _interned, _same),
+        ('title', 'title', _same, _same),
+        ('status', 'status', _interned, _same),
+        ('createTime', 'create_time', _int, _str),
+        ('updateTime', 'update_time', _int, _str),
+        ('tags', 'tags', _tuple, _list),
+        ('contentType', 'content_type', _interned, _same),
+        ('ownerId', 'owner_id', _interned, _same),
+        ('numberOfPages', 'number_of_pages', _int, _same),
+        ('errorCode', 'error_code', _interned, _same),
+        ('message', 'message', _same, _same),
+    )
+
+
+class Printer(Record):
+    """
+    A registered printer.
+
+    :ivar           id: printer ID
+    :ivar         name: name
+    :ivar display_name: name displayed to users
+    :ivar  description: description
+    :ivar        proxy: ID of the proxy the printer is connected through
+    :ivar       status: status message
+    :ivar         type: e.g. ``"GOOGLE"``
+    :ivar   connection: connection status, e.g. ``"ONLINE"``
+    :ivar  update_time: last update time in milliseconds since the epoch
+    :ivar         tags: `tuple` of tags
+
+    Capabilities, when present, are among the `extra` fields.
+    """
+    __slots__ = ('id', 'name', 'display_name', 'description', 'proxy',
+                 'status', 'type', 'connection', 'update_time', 'tags')
+    fields = (
+        ('id', 'id', _same, _same),
+        ('name', 'name', _same, _same),
+        ('displayName', 'display_name', _same, _same),
+        ('description', 'description', _same, _same),
+        ('proxy', 'proxy', _interned, _same),
+        ('status', 'status', _interned, _same),
+        ('type', 'type', _interned, _same),
+        ('connectionStatus', 'connection', _interned, _same),
+        ('updateTime', 'update_time', _int, _str),
+        ('tags', 'tags', _tuple, _list),
+    )
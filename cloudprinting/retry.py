@@ -0,0 +1,87 @@
+# coding: utf-8
+from email.utils import mktime_tz, parsedate_tz
+import random
+from time import time
+
+
+class RetryPolicy(object):
+    """
+    Decides whether, and when, a failed API call is retried.
+
+    :param max_attempts: maximum number of attempts, including the first
+    :type  max_attempts: int
+    :param      backoff: seconds to wait before the first retry, doubling for
+                         each subsequent retry
+    :type       backoff: float
+    :param  max_backoff: upper limit of seconds to wait between attempts
+    :type   max_backoff: float
+    :param       jitter: randomise each wait, so clients that failed together
+                         don't retry together
+    :type        jitter: bool
+    :param     deadline: seconds after the first attempt after which no more
+                         retries are made, `None` for no limit
+    :type      deadline: float
+    :param     statuses: HTTP status codes that are retried
+    :type      statuses: iterable of int
+
+    Connection errors and timeouts are retried as well. A ``Retry-After``
+    header on the response is honoured, unless it's beyond the deadline.
+
+    Only calls that are safe to repeat are retried: listing, deleting, and
+    submitting with a ``dedupe_key``.
+    """
+    def __init__(self, max_attempts=5, backoff=0.5, max_backoff=30,
+                 jitter=True, deadline=120,
+                 statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.statuses = frozenset(statuses)
+
+    def retryable(self, response):
+        """
+        `True` if *response* indicates a transient failure.
+        """
+        return response.status_code in self.statuses
+
+    def retry_after(self, response):
+        """
+        Returns the seconds requested by a ``Retry-After`` header, or `None`.
+        """
+        value = (response.headers.get('Retry-After')
+                 if response is not None else None)
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            date = parsedate_tz(value)
+            if date is None:
+                return None
+            return max(mktime_tz(date) - time(), 0)
+
+    def delay(self, attempt, started, response=None):
+        """
+        Returns seconds to wait before the next attempt, or `None` if no more
+        attempts should be made.
+
+        :param  attempt: number of attempts made so far
+        :type   attempt: int
+        :param  started: when the first attempt was made
+        :type   started: float
+        :param response: the failed response, if there was one
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if (self.deadline is not None
+                and time() + delay - started > self.deadline):
+            return None
+        return delay
@@ -0,0 +1,308 @@
+# coding: utf-8
+"""
+Rate limiting and fair scheduling of calls that submit and delete jobs.
+"""
+from collections import deque
+from concurrent.futures import Future
+import threading
+from time import time
+import requests
+from .client import default_client
+
+
+class TokenBucket(object):
+    """
+    Allows *rate* operations per second on average, in bursts of up to
+    *capacity*.
+
+    :param     rate: tokens added per second
+    :type      rate: float
+    :param capacity: most tokens held at once, defaults to *rate* (at least
+                     one)
+    :type  capacity: float
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = (float(capacity) if capacity is not None
+                         else max(self.rate, 1.0))
+        self.tokens = self.capacity
+        self.updated = time()
+        self.lock = threading.Lock()
+
+    def _fill(self):
+        now = time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens=1):
+        """
+        Returns the seconds until *tokens* are available, without taking
+        them.
+        """
+        with self.lock:
+            self._fill()
+            return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self, tokens=1):
+        """
+        Take *tokens*, whether or not they're available.
+        """
+        with self.lock:
+            self._fill()
+            self.tokens -= tokens
+
+    def reserve(self, tokens=1):
+        """
+        Take *tokens*, and returns the seconds to wait before using them.
+        Successive reservations queue up behind each other.
+        """
+        with self.lock:
+            self._fill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds):
+        """
+        Make no tokens available for *seconds*, e.g. after being throttled.
+        """
+        with self.lock:
+            self._fill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limits for an account, and for each of its printers.
+
+    :param  account_rate: calls per second for the whole account, or `None`
+                          for no limit
+    :type   account_rate: float
+    :param account_burst: calls allowed at once for the whole account
+    :type  account_burst: float
+    :param  printer_rate: calls per second for each printer, or `None` for
+                          no limit
+    :type   printer_rate: float
+    :param printer_burst: calls allowed at once for each printer
+    :type  printer_burst: float
+    """
+    def __init__(self, account_rate=10, account_burst=20, printer_rate=2,
+                 printer_burst=5):
+        self.account = (TokenBucket(account_rate, account_burst)
+                        if account_rate is not None else None)
+        self.printer_rate = printer_rate
+        self.printer_burst = printer_burst
+        self.printers = {}  # printer id -> TokenBucket
+        self.lock = threading.Lock()
+
+    def buckets(self, printer=None):
+        """
+        Returns the buckets that limit a call for *printer*.
+        """
+        buckets = [] if self.account is None else [self.account]
+        if printer is not None and self.printer_rate is not None:
+            with self.lock:
+                bucket = self.printers.get(printer)
+                if bucket is None:
+                    bucket = TokenBucket(self.printer_rate,
+                                         self.printer_burst)
+                    self.printers[printer] = bucket
+            buckets.append(bucket)
+        return buckets
+
+    def wait_time(self, printer=None):
+        """
+        Returns the seconds until a call for *printer* is allowed.
+        """
+        return max([0.0] + [bucket.wait_time()
+                            for bucket in self.buckets(printer)])
+
+    def take(self, printer=None):
+        """
+        Count a call for *printer*.
+        """
+        for bucket in self.buckets(printer):
+            bucket.take()
+
+    def reserve(self, printer=None):
+        """
+        Count a call for *printer*, and returns the seconds to wait before
+        making it.
+        """
+        return max([0.0] + [bucket.reserve()
+                            for bucket in self.buckets(printer)])
+
+    def throttle(self, seconds, printer=None):
+        """
+        Allow no calls for *seconds*. Used when the API responds with
+        ``429 Too Many Requests``.
+        """
+        for bucket in self.buckets(printer):
+            bucket.pause(seconds)
+
+
+class Scheduler(object):
+    """
+    Submits and deletes jobs in worker threads, within rate limits, taking
+    turns between tenants.
+
+    :param  client: client used to make calls, defaults to the client used by
+                    the module-level functions
+    :type   client: `CloudPrintClient`
+    :param limiter: rate limits of the account and each printer, defaults to
+                    `RateLimiter` with its default limits
+    :type  limiter: `RateLimiter`
+    :param workers: maximum number of calls made at once
+    :type  workers: int
+
+    Extra keyword arguments are passed to every call, e.g. ``auth``.
+
+    Each call is queued for its *tenant* (any hashable, e.g. a customer id or
+    a tag). Workers take the next call from each tenant in turn, skipping a
+    tenant whose next call is for a printer that's over its limit, so a
+    tenant flooding one printer doesn't hold up the others. A tenant's calls
+    are made in the order they were queued::
+
+        >>> with Scheduler(auth=auth) as scheduler:
+        ...     futures = [scheduler.submit_job(printer, path,
+        ...                                     tenant=customer)
+        ...                for customer, printer, path in work]
+        >>> [f.result()['success'] for f in futures]
+        [True, True, ...]
+
+    If the API responds with ``429 Too Many Requests`` anyway, further calls
+    are paused for its ``Retry-After`` (or *throttle_delay*) seconds.
+    """
+    throttle_delay = 1
+
+    def __init__(self, client=None, limiter=None, workers=8, **kwargs):
+        self.client = client
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.workers = workers
+        self.kwargs = kwargs
+        self._queues = {}  # tenant -> deque of calls
+        self._order = deque()  # tenants with queued calls, next first
+        self._condition = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def submit_job(self, printer, content, tenant=None, **kwargs):
+        """
+        Queue a call to `submit_job`.
+
+        :param tenant: who the call is made for
+        :returns: `concurrent.futures.Future` resolved with the result of
+                  `submit_job`
+        """
+        return self._put(tenant, printer, "submit_job", (printer, content),
+                         kwargs)
+
+    def delete_job(self, id, printer=None, tenant=None, **kwargs):
+        """
+        Queue a call to `delete_job`. The printer's limit only applies if
+        *printer* is given.
+
+        :param tenant: who the call is made for
+        :returns: `concurrent.futures.Future` resolved with the result of
+                  `delete_job`
+        """
+        return self._put(tenant, printer, "delete_job", (id,), kwargs)
+
+    def _put(self, tenant, printer, method, args, kwargs):
+        future = Future()
+        options = dict(self.kwargs)
+        options.update(kwargs)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule calls after shutdown")
+            queue = self._queues.get(tenant)
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+                self._order.append(tenant)
+            queue.append((printer, future, method, args, options))
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work,
+                    name="Scheduler-%d" % len(self._threads))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._condition.notify()
+        return future
+
+    def _next(self):
+        """
+        Wait for the next call that's within the limits, or returns `None`
+        once shut down.
+        """
+        with self._condition:
+            while True:
+                wait = None
+                for _ in range(len(self._order)):
+                    tenant = self._order[0]
+                    self._order.rotate(-1)
+                    queue = self._queues[tenant]
+                    while queue and queue[0][1].cancelled():
+                        queue.popleft()
+                    if queue:
+                        delay = self.limiter.wait_time(queue[0][0])
+                        if delay > 0:
+                            wait = delay if wait is None else min(wait, delay)
+                            continue
+                        call = queue.popleft()
+                    else:
+                        call = None
+                    if not queue:
+                        del self._queues[tenant]
+                        self._order.remove(tenant)
+                    if call is not None:
+                        self.limiter.take(call[0])
+                        return call
+                if self._shutdown and not self._queues:
+                    return None
+                self._condition.wait(wait)
+
+    def _work(self):
+        while True:
+            call = self._next()
+            if call is None:
+                return
+            printer, future, method, args, kwargs = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = getattr(self.client or default_client(),
+                                 method)(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if (isinstance(result, requests.Response)
+                    and result.status_code == 429):
+                try:
+                    delay = float(result.headers.get('Retry-After'))
+                except (TypeError, ValueError):
+                    delay = self.throttle_delay
+                self.limiter.throttle(delay, printer)
+            future.set_result(result)
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting calls. Queued calls are still made; with *wait*, this
+        returns once they have been.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,338 @@
+# coding: utf-8
+"""
+A durable local queue of print jobs, submitted in the background.
+"""
+import json
+import os
+from os.path import basename, exists, join
+import shutil
+import sqlite3
+import threading
+from time import time
+from uuid import uuid4
+import requests
+from .client import DEDUPE_TAG_PREFIX, default_client
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    printer TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL,
+    lease_until REAL,
+    job_id TEXT,
+    error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (state, not_before);
+"""
+
+
+class Spooler(object):
+    """
+    Queues print jobs on disk, so they can be submitted by background workers
+    rather than while the caller waits.
+
+    :param         path: directory holding the queue, created if necessary
+    :type          path: string
+    :param       client: client used to submit jobs, defaults to the client
+                         used by the module-level functions
+    :type        client: `CloudPrintClient`
+    :param      workers: number of jobs submitted at once by `start`
+    :type       workers: int
+    :param        lease: seconds a worker may spend on a job before it's
+                         considered lost and submitted again
+    :type         lease: float
+    :param max_attempts: attempts before a job is marked ``failed``
+    :type  max_attempts: int
+    :param  retry_delay: seconds before the second attempt, doubled for each
+                         attempt after that
+    :type   retry_delay: float
+    :param    max_delay: upper limit of seconds between attempts
+    :type     max_delay: float
+
+    Extra keyword arguments are passed to `submit_job`, e.g. ``auth``.
+
+    `enqueue_job` copies the document into the spool directory and records
+    the job in an SQLite database, then returns at once::
+
+        >>> spooler = Spooler("/var/spool/cloudprinting", auth=auth)
+        >>> spooler.start()
+        >>> spool_id = spooler.enqueue_job(printer, "test.pdf")
+        >>> spooler.status(spool_id)['state']
+        'queued'
+
+    Workers claim a job by taking a lease on it. If a process dies while
+    submitting, the lease expires and the job is claimed again, by this or
+    another process using the same directory, so each job is delivered at
+    least once. The spool id is used as the job's *dedupe_key*, and before a
+    job is submitted again the printer is checked for it, so in practice a
+    job is rarely printed twice.
+
+    A job is ``queued`` until it's ``done`` (``job_id`` is set) or has failed
+    *max_attempts* times or been rejected by the API (``failed``, with
+    ``error`` set).
+    """
+    poll_interval = 1
+
+    def __init__(self, path, client=None, workers=4, lease=300,
+                 max_attempts=10, retry_delay=5, max_delay=300, **kwargs):
+        self.path = path
+        self.client = client
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self.kwargs = kwargs
+        self.documents = join(path, "documents")
+        if not exists(self.documents):
+            os.makedirs(self.documents)
+        self._local = threading.local()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        """
+        Returns this thread's connection to the database.
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(join(self.path, "spool.db"), timeout=30,
+                                 isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def enqueue_job(self, printer, content, title=None, capabilities=None,
+                    tags=None, content_type=None):
+        """
+        Add a print job to the queue.
+
+        :param      printer: the id of the printer to use
+        :type       printer: string
+        :param      content: what should be printed, see `submit_job`
+        :type       content: ``(name, file-like)`` pair or path or URL
+        :param        title: title of the print job
+        :type         title: string
+        :param capabilities: capabilities for the printer
+        :type  capabilities: list
+        :param         tags: tags for the print job
+        :type          tags: list of strings
+        :param content_type: MIME type of the document
+        :type  content_type: string
+        :returns: the spool id of the job
+        """
+        id = uuid4().hex
+        spec = {"title": title, "capabilities": capabilities,
+                "tags": tags, "content_type": content_type}
+        if content_type == "url":
+            spec['content'] = content
+        else:
+            if isinstance(content, (list, tuple)):
+                name, f = content
+                opened = False
+            else:
+                name = basename(content)
+                f = open(content, 'rb')
+                opened = True
+            spec['name'] = name
+            # written under a temporary name, so a crash can't leave a
+            # partial document behind a queued job
+            partial = join(self.documents, id + ".partial")
+            try:
+                with open(partial, 'wb') as out:
+                    shutil.copyfileobj(f, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+            finally:
+                if opened:
+                    f.close()
+            os.rename(partial, join(self.documents, id))
+        now = time()
+        self._db().execute(
+            "INSERT INTO jobs (id, printer, spec, state, not_before, created)"
+            " VALUES (?, ?, ?, 'queued', ?, ?)",
+            (id, printer, json.dumps(spec), now, now))
+        self._wakeup.set()
+        return id
+
+    def status(self, id):
+        """
+        Returns a `dict` describing a spooled job, or `None` if it's unknown.
+        """
+        row = self._db().execute(
+            "SELECT id, printer, state, attempts, job_id, error, created"
+            " FROM jobs WHERE id = ?", (id,)).fetchone()
+        return dict(zip(row.keys(), row)) if row is not None else None
+
+    def pending(self):
+        """
+        Returns the number of queued jobs.
+        """
+        return self._db().execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+    def purge(self, age=86400):
+        """
+        Forget ``done`` and ``failed`` jobs created more than *age* seconds
+        ago.
+        """
+        db = self._db()
+        ids = [row[0] for row in db.execute(
+            "SELECT id FROM jobs WHERE state != 'queued' AND created < ?",
+            (time() - age,))]
+        for id in ids:
+            self._remove_document(id)
+            db.execute("DELETE FROM jobs WHERE id = ?", (id,))
+        return len(ids)
+
+    def _remove_document(self, id):
+        try:
+            os.remove(join(self.documents, id))
+        except OSError:
+            pass
+
+    def claim(self):
+        """
+        Take a lease on the next job that's due, or returns `None`.
+        """
+        db = self._db()
+        now = time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' AND not_before <= ?"
+                " AND (lease_until IS NULL OR lease_until < ?)"
+                " ORDER BY not_before LIMIT 1", (now, now)).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET lease_until = ?,"
+                           " attempts = attempts + 1 WHERE id = ?",
+                           (now + self.lease, row['id']))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row
+
+    def deliver(self, row):
+        """
+        Submit a claimed job, and record the outcome.
+
+        :returns: `True` if the job was submitted
+        """
+        client = self.client or default_client()
+        spec = json.loads(row['spec'])
+        id = row['id']
+        job = None
+        error = None
+        rejected = False
+        try:
+            if row['attempts'] > 0:
+                # a previous attempt may have succeeded before failing
+                job = client.find_tagged(row['printer'],
+                                         DEDUPE_TAG_PREFIX + id,
+                                         self.kwargs.get('auth'))
+            if job is None:
+                job = self._submit(client, row['printer'], id, spec)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+        else:
+            if isinstance(job, requests.Response):
+                error = "HTTP %d: %s" % (job.status_code, job.text[:200])
+            elif job.get('success') is False:
+                # the API refused the job, so trying again won't help
+                error = job.get('message') or "Job was rejected"
+                rejected = True
+
+        db = self._db()
+        if error is None:
+            db.execute("UPDATE jobs SET state = 'done', job_id = ?,"
+                       " lease_until = NULL, error = NULL WHERE id = ?",
+                       (job['id'], id))
+            self._remove_document(id)
+            return True
+        # attempts counts this one, as it was incremented when claimed
+        attempts = row['attempts'] + 1
+        if rejected or attempts >= self.max_attempts:
+            db.execute("UPDATE jobs SET state = 'failed', error = ?,"
+                       " lease_until = NULL WHERE id = ?", (error, id))
+            self._remove_document(id)
+        else:
+            delay = min(self.retry_delay * 2 ** (attempts - 1),
+                        self.max_delay)
+            db.execute("UPDATE jobs SET not_before = ?, error = ?,"
+                       " lease_until = NULL WHERE id = ?",
+                       (time() + delay, error, id))
+        return False
+
+    def _submit(self, client, printer, id, spec):
+        """
+        Returns the submitted job, the HTTP response on failure, or the API
+        response if the job was rejected.
+        """
+        kwargs = dict(self.kwargs)
+        kwargs.update(title=spec['title'], capabilities=spec['capabilities'],
+                      tags=spec['tags'], content_type=spec['content_type'],
+                      dedupe_key=id)
+        if spec['content_type'] == "url":
+            r = client.submit_job(printer, spec['content'], **kwargs)
+        else:
+            with open(join(self.documents, id), 'rb') as f:
+                r = client.submit_job(printer, (spec['name'], f), **kwargs)
+        if isinstance(r, requests.Response):
+            return r
+        return r['job'] if r.get('success', True) else r
+
+    def drain(self):
+        """
+        Submit queued jobs in this thread until none are due.
+
+        :returns: the number of jobs submitted
+        """
+        submitted = 0
+        while not self._stopping.is_set():
+            row = self.claim()
+            if row is None:
+                break
+            if self.deliver(row):
+                submitted += 1
+        return submitted
+
+    def run(self):
+        """
+        Submit jobs as they become due until `stop` is called.
+        """
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            if not self.drain():
+                self._wakeup.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Submit jobs in *workers* background threads.
+        """
+        if not self._threads:
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.run,
+                                          name="Spooler-%d" % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the background threads started by `start`. Jobs being submitted
+        are finished first.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
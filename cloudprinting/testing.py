@@ -0,0 +1,383 @@
+# coding: utf-8
+"""
+A local stand-in for the Google Cloud Print API, for tests and benchmarks.
+
+Example::
+
+    >>> with MockCloudPrintServer(latency=0.01) as server:
+    ...     client = CloudPrintClient(base_url=server.url)
+    ...     client.submit_job(server.printers[0]['id'], "test.pdf")
+    {"success": True, "job": {...}}
+
+Point `OAuth2` at ``server.token_url`` (via its ``token_endpoint``
+attribute) to exercise token refreshing too.
+"""
+import json
+import random
+import re
+import socket
+import threading
+from time import sleep, time
+from uuid import uuid4
+import zlib
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+# only this much of an upload is kept, for parsing the form fields that
+# precede the document; the rest is counted and discarded
+HEAD_SIZE = 65536
+CHUNK_SIZE = 65536
+
+
+def _parse_fields(head, content_type):
+    """
+    Returns the form fields found in the start of a multipart body.
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if match is None:
+        return {}
+    boundary = b"--" + match.group(1).encode("ascii")
+    fields = {}
+    for part in head.split(boundary)[1:]:
+        headers, _, value = part.partition(b"\r\n\r\n")
+        name = re.search(br'name="([^"]*)"', headers)
+        if name is None or b"filename=" in headers or not _:
+            continue
+        if not value.endswith(b"\r\n"):
+            continue  # truncated by HEAD_SIZE
+        key = name.group(1).decode("utf-8")
+        fields.setdefault(key, []).append(value[:-2].decode("utf-8"))
+    return fields
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # headers and body are written separately, don't let Nagle's
+        # algorithm delay the body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        """
+        Returns the start of the request body, and the size of all of it.
+        """
+        head = []
+        kept = size = 0
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = self._read_chunked()
+        else:
+            chunks = self._read_length(
+                int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            decompressor = None
+        for chunk in chunks:
+            size += len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            if kept < HEAD_SIZE:
+                head.append(chunk[:HEAD_SIZE - kept])
+                kept += len(head[-1])
+        return b"".join(head), size
+
+    def _read_length(self, length):
+        while length > 0:
+            chunk = self.rfile.read(min(length, CHUNK_SIZE))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+    def _read_chunked(self):
+        while True:
+            length = int(self.rfile.readline().split(b";")[0], 16)
+            if length == 0:
+                self.rfile.readline()
+                break
+            for chunk in self._read_length(length):
+                yield chunk
+            self.rfile.readline()
+
+    def _respond(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        if (self.server.mock.gzip and len(body) > 1024
+                and 'gzip' in self.headers.get('Accept-Encoding', '')):
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        # the real `/jobs` API responds with text/plain
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        server = self.server.mock
+        url = urlparse(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        if method == "POST":
+            head, size = self._read_body()
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/form-data'):
+                fields = _parse_fields(head, content_type)
+            else:
+                fields = parse_qs(head.decode("utf-8"))
+            params.update((k, v if k == 'tag' else v[-1])
+                          for k, v in fields.items())
+        else:
+            size = 0
+        server.received += size
+
+        if server.latency:
+            sleep(server.latency)
+        status, data, headers = server.dispatch(
+            method, url.path, params, self.headers.get('Authorization'))
+        self._respond(status, data, headers)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockCloudPrintServer(object):
+    """
+    Emulates ``/submit``, ``/jobs``, ``/search``, ``/printer``, ``/deletejob``
+    and the OAuth2 token endpoint on a local port, in a background thread.
+
+    :param          latency: seconds added to every response
+    :type           latency: float
+    :param     failure_rate: probability of a request failing with
+                             *failure_status*
+    :type      failure_rate: float
+    :param   failure_status: HTTP status of injected failures
+    :type    failure_status: int
+    :param      retry_after: value of the ``Retry-After`` header on injected
+                             failures, if any
+    :param  processing_time: seconds before a submitted job is ``DONE``
+    :type   processing_time: float
+    :param         printers: number of printers registered
+    :type          printers: int
+    :param     require_auth: reject requests without a token issued by the
+                             token endpoint
+    :type      require_auth: bool
+    :param             gzip: compress large responses if the client accepts
+                             gzip
+    :type              gzip: bool
+    :param             seed: seed for failure injection
+
+    Requests with a gzip ``Content-Encoding`` are decompressed. ``received``
+    counts the bytes of request bodies as sent.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0, failure_rate=0,
+                 failure_status=503, retry_after=None, processing_time=0,
+                 printers=1, require_auth=False, gzip=True, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.processing_time = processing_time
+        self.require_auth = require_auth
+        self.gzip = gzip
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.tokens = set()
+        self.requests = {}  # path -> count
+        self.received = 0
+        self.printers = [{"id": "mock-printer-%d" % i,
+                          "name": "Mock Printer %d" % i,
+                          "displayName": "Mock Printer %d" % i,
+                          "proxy": "mock-proxy",
+                          "status": "",
+                          "type": "GOOGLE",
+                          "updateTime": str(int(time() * 1000))}
+                         for i in range(printers)]
+        # every other printer is a colour duplex printer
+        self.capabilities = dict(
+            (printer['id'], {"printer": {
+                "color": {"option": [{"type": "STANDARD_MONOCHROME"}]
+                          + ([{"type": "STANDARD_COLOR"}] if i % 2 else [])},
+                "duplex": {"option": [{"type": "NO_DUPLEX"}]
+                           + ([{"type": "LONG_EDGE"}] if i % 2 else [])},
+                "media_size": {"option": [{"name": "ISO_A4"},
+                                          {"name": "NA_LETTER"}]}}})
+            for i, printer in enumerate(self.printers))
+        self._failures = 0
+        self._httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        Use as the ``base_url`` of a client, in place of `CLOUDPRINT_URL`.
+        """
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def token_url(self):
+        """
+        Use as `OAuth2.token_endpoint`.
+        """
+        return self.url + "/token"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Serve requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name="MockCloudPrintServer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def fail_next(self, count=1):
+        """
+        Make the next *count* requests fail with *failure_status*.
+        """
+        with self.lock:
+            self._failures += count
+
+    def dispatch(self, method, path, params, authorization):
+        """
+        Returns ``(status, data, headers)`` for a request.
+        """
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            fail = self._failures > 0
+            if fail:
+                self._failures -= 1
+        if path == "/token":
+            return self._token(params)
+        if fail or (self.failure_rate
+                    and self.random.random() < self.failure_rate):
+            headers = {}
+            if self.retry_after is not None:
+                headers['Retry-After'] = str(self.retry_after)
+            return self.failure_status, {"success": False,
+                                         "message": "Injected failure"}, \
+                headers
+        if self.require_auth and authorization not in self.tokens:
+            return 403, {"success": False, "message": "Forbidden"}, None
+        handler = getattr(self, "_" + path.strip("/").replace("/", "_"),
+                          None)
+        if handler is None:
+            return 404, {"success": False, "message": "Not found"}, None
+        return handler(params)
+
+    def _token(self, params):
+        token = uuid4().hex
+        with self.lock:
+            self.tokens.add("Bearer " + token)
+        return 200, {"access_token": token, "token_type": "Bearer",
+                     "expires_in": 3600}, None
+
+    def _job_status(self, job):
+        if (job['status'] == "QUEUED"
+                and time() - job['_submitted'] >= self.processing_time):
+            job['status'] = "DONE"
+            job['updateTime'] = str(int(time() * 1000))
+        return job
+
+    def _public(self, job):
+        return dict((k, v) for k, v in job.items() if not k.startswith("_"))
+
+    def _submit(self, params):
+        if not any(p['id'] == params.get('printerid')
+                   for p in self.printers):
+            return 200, {"success": False,
+                         "message": "Printer does not exist."}, None
+        now = time()
+        tags = params.get('tag') or []
+        job = {"id": uuid4().hex,
+               "printerid": params['printerid'],
+               "title": params.get('title', ""),
+               "contentType": params.get('contentType', ""),
+               "status": "QUEUED",
+               "tags": tags if isinstance(tags, list) else [tags],
+               "createTime": str(int(now * 1000)),
+               "updateTime": str(int(now * 1000)),
+               "_submitted": now}
+        with self.lock:
+            self.jobs[job['id']] = job
+        return 200, {"success": True, "message": "Print job added.",
+                     "job": self._public(job)}, None
+
+    def _jobs(self, params):
+        printer = params.get('printerid')
+        with self.lock:
+            jobs = [self._public(self._job_status(job))
+                    for job in self.jobs.values()
+                    if printer is None or job['printerid'] == printer]
+        jobs.sort(key=lambda job: int(job['createTime']),
+                  reverse=params.get('sortorder') != "CREATE_TIME")
+        if params.get('status'):
+            jobs = [job for job in jobs if job['status'] == params['status']]
+        total = len(jobs)
+        offset = int(params.get('offset') or 0)
+        if params.get('limit'):
+            jobs = jobs[offset:offset + int(params['limit'])]
+        else:
+            jobs = jobs[offset:]
+        return 200, {"success": True, "jobs": jobs,
+                     "range": {"jobsCount": len(jobs), "jobsTotal": total,
+                               "offset": offset}}, None
+
+    def _search(self, params):
+        return 200, {"success": True, "printers": self.printers}, None
+
+    def _printer(self, params):
+        for printer in self.printers:
+            if printer['id'] == params.get('printerid'):
+                printer = dict(printer)
+                printer['capabilities'] = self.capabilities[printer['id']]
+                return 200, {"success": True, "printers": [printer]}, None
+        return 200, {"success": False,
+                     "message": "Printer does not exist."}, None
+
+    def _deletejob(self, params):
+        with self.lock:
+            job = self.jobs.pop(params.get('jobid'), None)
+        if job is None:
+            return 200, {"success": False,
+                         "message": "Job does not exist."}, None
+        return 200, {"success": True, "message": "Print job deleted."}, None
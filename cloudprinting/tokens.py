@@ -0,0 +1,121 @@
+# coding: utf-8
+"""
+Stores that share `OAuth2` access tokens between instances and processes.
+"""
+from contextlib import contextmanager
+import json
+import os
+from os.path import dirname
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class TokenStore(object):
+    """
+    Interface for a store of access tokens, keyed by `OAuth2.store_key`.
+
+    Tokens are represented as a `dict` with ``access_token``, ``token_type``
+    and ``expires_at`` (a UNIX timestamp, or `None`).
+
+    Subclasses must implement `get`, `set` and `lock`.
+    """
+    def get(self, key):
+        """
+        Returns the tokens stored for *key*, or `None`.
+        """
+        raise NotImplementedError
+
+    def set(self, key, tokens):
+        """
+        Store the tokens for *key*.
+        """
+        raise NotImplementedError
+
+    def lock(self, key):
+        """
+        Returns a context manager that holds an exclusive lock for *key* among
+        all users of the store. `OAuth2` holds it while refreshing, so only
+        one refresh happens when a token expires.
+        """
+        raise NotImplementedError
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Shares tokens between `OAuth2` instances in the same process.
+    """
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        tokens = self._tokens.get(key)
+        return dict(tokens) if tokens is not None else None
+
+    def set(self, key, tokens):
+        self._tokens[key] = dict(tokens)
+
+    def lock(self, key):
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+        return lock
+
+
+class FileTokenStore(TokenStore):
+    """
+    Shares tokens between processes on the same host, via a JSON file.
+
+    :param path: path of the file, which is created if it doesn't exist
+    :type  path: string
+
+    Locking uses ``flock`` on a ``<path>.lock`` file, so this store is only
+    available on POSIX systems. The file contains access tokens, so it should
+    only be readable by the user running the application.
+    """
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError("FileTokenStore requires fcntl (POSIX).")
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        return self._read().get(key)
+
+    def set(self, key, tokens):
+        data = self._read()
+        data[key] = tokens
+        # replace the file atomically, so readers never see a partial write
+        fd, temp = tempfile.mkstemp(dir=dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.rename(temp, self.path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    @contextmanager
+    def lock(self, key):
+        # a single lock for the file covers every key
+        with self._lock:
+            with open(self.path + ".lock", 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,163 @@
+# coding: utf-8
+from concurrent.futures import Future
+import threading
+import requests
+from .client import default_client
+
+
+class JobWatcher(object):
+    """
+    Waits for many jobs to finish by polling each printer's job list.
+
+    :param       client: client used to list jobs, defaults to the client
+                         used by the module-level functions
+    :type        client: `CloudPrintClient`
+    :param min_interval: seconds between polls while jobs are changing
+    :type  min_interval: float
+    :param max_interval: upper limit of seconds between polls
+    :type  max_interval: float
+    :param      backoff: factor the interval grows by after each poll where no
+                         job changed status
+    :type       backoff: float
+
+    Extra keyword arguments are passed to `list_jobs`, e.g. ``auth``.
+
+    Each poll makes one `list_jobs` call per printer (or a single call if a
+    job was watched without a printer), regardless of the number of jobs
+    watched::
+
+        >>> watcher = JobWatcher(auth=auth)
+        >>> futures = [watcher.watch(job['id'], printer) for job in jobs]
+        >>> watcher.start()
+        >>> [f.result()['status'] for f in futures]
+        ['DONE', 'DONE', 'ERROR']
+
+    """
+    terminal = frozenset(["DONE", "ERROR", "ABORTED"])
+
+    def __init__(self, client=None, min_interval=1, max_interval=30,
+                 backoff=1.5, **kwargs):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.kwargs = kwargs
+        self.interval = min_interval
+        self.lock = threading.Lock()
+        self._watched = {}  # id -> [printer, future, status]
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def __len__(self):
+        return len(self._watched)
+
+    def watch(self, id, printer=None, callback=None):
+        """
+        Start watching a job.
+
+        :param       id: job ID
+        :type        id: string
+        :param  printer: the printer id of the job, if known
+        :type   printer: string
+        :param callback: called with the job `dict` once it's finished, but
+                         not if the job is unwatched
+        :returns: `concurrent.futures.Future` resolved with the job `dict` once
+                  its status is ``DONE``, ``ERROR`` or ``ABORTED``
+        """
+        with self.lock:
+            if id in self._watched:
+                future = self._watched[id][1]
+            else:
+                future = Future()
+                self._watched[id] = [printer, future, None]
+            self.interval = self.min_interval
+        if callback is not None:
+            def done(f):
+                if not f.cancelled() and f.exception() is None:
+                    callback(f.result())
+            future.add_done_callback(done)
+        return future
+
+    def unwatch(self, id):
+        """
+        Stop watching a job, its future is cancelled.
+        """
+        with self.lock:
+            watched = self._watched.pop(id, None)
+        if watched is not None:
+            watched[1].cancel()
+
+    def poll(self):
+        """
+        Check the status of every watched job once.
+
+        :returns: the number of jobs whose status changed
+        """
+        with self.lock:
+            printers = set(printer for printer, _, _ in
+                           self._watched.values())
+        if None in printers:
+            printers = set([None])
+
+        client = self.client or default_client()
+        changed = 0
+        for printer in printers:
+            jobs = client.list_jobs(printer=printer, **self.kwargs)
+            if isinstance(jobs, requests.Response):
+                continue
+            finished = []
+            with self.lock:
+                for job in jobs:
+                    watched = self._watched.get(job['id'])
+                    if watched is None:
+                        continue
+                    if watched[2] != job['status']:
+                        watched[2] = job['status']
+                        changed += 1
+                    if job['status'] in self.terminal:
+                        del self._watched[job['id']]
+                        finished.append((watched[1], job))
+            for future, job in finished:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(job)
+
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff,
+                                self.max_interval)
+        return changed
+
+    def run(self):
+        """
+        Poll until `stop` is called.
+        """
+        while not self._stopping.is_set():
+            if self._watched:
+                try:
+                    self.poll()
+                except requests.RequestException:
+                    # keep watching, but back off while the API is unreachable
+                    self.interval = min(self.interval * self.backoff,
+                                        self.max_interval)
+            self._stopping.wait(self.interval)
+
+    def start(self):
+        """
+        Poll in a background thread.
+        """
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run,
+                                            name="JobWatcher")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread started by `start`.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
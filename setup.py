@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 from os.path import join
 import re
+import sys
 from setuptools import setup
 
 # dynamically pull the version from cloudprinting/__init__.py
 with open(join('cloudprinting', '__init__.py'), 'r') as f:
     version = re.search('^__version__ = "(.+?)"$', f.read(), re.MULTILINE).group(1)
 
+install_requires = ['requests']
+if sys.version_info < (3, 2):
+    install_requires.append('futures')
+
 setup(
     name='cloudprinting',
     version=version,
@@ -18,13 +23,18 @@ setup(
     packages=['cloudprinting'],
     include_package_data=True,  # declarations in MANIFEST.in
 
-    install_requires=['requests'],
+    install_requires=install_requires,
+    python_requires='>=2.7, !=3.0.*, !=3.1.*',
+    extras_require={'async': ['aiohttp'], 'streaming': ['ijson>=3.1']},
 
     classifiers=[
         'Environment :: Web Environment',
         'Intended Audience :: Developers',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 2',
+        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Topic :: Internet',
         'Topic :: Software Development :: Libraries',
     ],
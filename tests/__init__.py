@@ -1,12 +1,53 @@
 # coding: utf-8
 from attest import assert_hook, Tests, raises
-from cloudprinting import (delete_job, get_job, list_jobs, list_printers,
-                           OAuth2, submit_job)
+from cloudprinting import client
+from cloudprinting import (AccountPool, CloudPrintClient, delete_job,
+                           delete_jobs, DocumentCache, get_job, Job,
+                           job_filter, JobCache, JobChangeFeed, JobWatcher,
+                           list_jobs, list_printers, MemoryTokenStore,
+                           MetricsRegistry, OAuth2, Printer, PrinterDirectory,
+                           RateLimiter, RetryPolicy, Scheduler, Spooler,
+                           submit_job, TokenBucket)
+from cloudprinting.__main__ import Context, forward, RecordWriter, serve
+from cloudprinting.compression import compressible
+from cloudprinting.multipart import MultipartEncoder
+from cloudprinting.testing import MockCloudPrintServer
+from argparse import Namespace
+from io import BytesIO
+import json
+import logging
+from logging.handlers import BufferingHandler
+import os
 from os import environ
 from os.path import dirname, join
 import requests
-from time import sleep
+import shutil
+import tempfile
+import threading
+from time import sleep, time
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    import asyncio
+    from cloudprinting.aio import AsyncCloudPrintClient
+except (ImportError, SyntaxError):
+    # needs Python 3.5+ and aiohttp
+    AsyncCloudPrintClient = None
+
+
+if environ.get('CP_MOCK'):
+    # run against a local stand-in for Google Cloud Print
+    server = MockCloudPrintServer(require_auth=True)
+    server.start()
+    client.CLOUDPRINT_URL = server.url
+    OAuth2.token_endpoint = server.token_url
+    for name in ('CP_CLIENT_ID', 'CP_CLIENT_SECRET', 'CP_REFRESH_TOKEN'):
+        environ.setdefault(name, 'mock')
+    environ.setdefault('CP_PRINTER_ID', server.printers[0]['id'])
 
 PRINTER_ID = environ.get('CP_PRINTER_ID', '__google__docs')
 PDF = join(dirname(__file__), "test.pdf")
@@ -26,12 +67,315 @@ def oauth2_requires_argument_sets():
     OAuth2(client_id="foo", client_secret="bar", refresh_token="baz")
 
 
+@suite.test
+def oauth2_expires_ahead_of_expiry_time():
+    oauth2 = OAuth2(access_token="foo", token_type="bar", expires_in=30,
+                    client_id="foo", client_secret="bar", refresh_token="baz",
+                    refresh_margin=60)
+    assert oauth2.expired
+    oauth2.refresh_margin = 10
+    assert not oauth2.expired
+
+    # without the means to refresh, the token is used until it's rejected
+    oauth2 = OAuth2(access_token="foo", token_type="bar", expires_in=30,
+                    refresh_margin=60)
+    assert not oauth2.expired
+
+
+@suite.test
+def oauth2_auto_refresh():
+    oauth2 = OAuth2(client_id=environ['CP_CLIENT_ID'],
+                    client_secret=environ['CP_CLIENT_SECRET'],
+                    refresh_token=environ['CP_REFRESH_TOKEN'])
+    oauth2.start_auto_refresh()
+    try:
+        for i in range(10):
+            if not oauth2.expired:
+                break
+            sleep(1)
+        assert not oauth2.expired
+        assert oauth2.expires_at is not None
+    finally:
+        oauth2.stop_auto_refresh()
+
+
+@suite.test
+def oauth2_shares_tokens_through_store():
+    store = MemoryTokenStore()
+    first, second = [OAuth2(client_id=environ['CP_CLIENT_ID'],
+                            client_secret=environ['CP_CLIENT_SECRET'],
+                            refresh_token=environ['CP_REFRESH_TOKEN'],
+                            store=store) for i in range(2)]
+    first.refresh()
+    second.refresh()
+    assert second.access_token == first.access_token
+    assert store.get(first.store_key)['access_token'] == first.access_token
+
+
+@suite.test
+def oauth2_refreshes_rejected_token_of_streamed_upload():
+    with MockCloudPrintServer(require_auth=True) as mock:
+        oauth2 = OAuth2(access_token="revoked", token_type="Bearer",
+                        client_id="foo", client_secret="bar",
+                        refresh_token="baz")
+        oauth2.token_endpoint = mock.token_url
+        with CloudPrintClient(auth=oauth2, base_url=mock.url) as client:
+            # the consumed body can't be sent again, but the token is renewed
+            r = client.submit_job(mock.printers[0]['id'], PDF,
+                                  streaming=True)
+            assert r.status_code == 403
+            assert oauth2.access_token != "revoked"
+            assert isinstance(client.list_jobs(), list)
+
+
+if AsyncCloudPrintClient is not None:
+    def run_async(client, *coroutines):
+        """
+        Returns the results of *coroutines*, run one after another, then
+        closes *client*.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            results = [loop.run_until_complete(coroutine)
+                       for coroutine in coroutines]
+            loop.run_until_complete(client.close())
+        finally:
+            loop.close()
+        return results
+
+    @suite.test
+    def async_client_refreshes_through_oauth2():
+        store = MemoryTokenStore()
+        with MockCloudPrintServer(require_auth=True) as mock:
+            oauth2 = OAuth2(client_id="foo", client_secret="bar",
+                            refresh_token="baz", store=store)
+            oauth2.token_endpoint = mock.token_url
+            client = AsyncCloudPrintClient(auth=oauth2, base_url=mock.url)
+            jobs, = run_async(client, client.list_jobs())
+        assert jobs == []
+        assert mock.requests["/token"] == 1
+        assert store.get(oauth2.store_key)['access_token'] == \
+            oauth2.access_token
+
+
+    @suite.test
+    def async_client_submits_many_jobs():
+        with MockCloudPrintServer(require_auth=True) as mock:
+            oauth2 = OAuth2(access_token="revoked", token_type="Bearer",
+                            client_id="foo", client_secret="bar",
+                            refresh_token="baz")
+            oauth2.token_endpoint = mock.token_url
+            printer = mock.printers[0]['id']
+            client = AsyncCloudPrintClient(auth=oauth2, base_url=mock.url)
+            specs = [{"printer": printer, "content": PDF, "tags": ["a"]}] * 3
+            specs.append({"printer": "no-such-printer", "content": PDF})
+            specs.append({"printer": printer,
+                          "content": join(dirname(PDF), "missing.pdf")})
+            results, = run_async(client, client.submit_many(specs,
+                                                            concurrency=2))
+            assert [r['success'] for r in results[:4]] == [True] * 3 + [False]
+            assert isinstance(results[4], IOError)
+            assert mock.requests["/token"] == 1
+            assert len(mock.jobs) == 3
+
+            id = results[0]['job']['id']
+            client = AsyncCloudPrintClient(auth=oauth2, base_url=mock.url)
+            job, deleted, missing = run_async(
+                client, client.get_job(id, printer), client.delete_job(id),
+                client.get_job(id))
+            assert job['tags'] == ["a"]
+            assert deleted['success']
+            assert missing is None
+            assert len(mock.jobs) == 2
+
+    @suite.test
+    def async_client_returns_rejections_it_cannot_refresh():
+        with MockCloudPrintServer(require_auth=True) as mock:
+            oauth2 = OAuth2(access_token="revoked", token_type="Bearer")
+            client = AsyncCloudPrintClient(auth=oauth2, base_url=mock.url)
+            r, = run_async(client, client.list_jobs())
+        assert r.status == 403
+        assert mock.requests.get("/token") is None
+        assert mock.requests["/jobs"] == 1
+
+
 @suite.test
 def listing_printers():
     printers = list_printers(auth=auth)['printers']
     assert isinstance(printers, list)
 
 
+@suite.test
+def client_reuses_session():
+    with CloudPrintClient(auth=auth) as client:
+        printers = client.list_printers()['printers']
+        assert isinstance(printers, list)
+        jobs = client.list_jobs()
+        assert isinstance(jobs, list)
+
+
+@suite.test
+def client_instrumentation():
+    metrics = MetricsRegistry()
+    with CloudPrintClient(auth=auth, instrumentation=metrics) as client:
+        client.list_printers()
+        job = client.submit_job(PRINTER_ID, PDF, streaming=True)['job']
+        client.delete_job(job['id'])
+    assert metrics.value("cloudprinting_calls_total", call="search",
+                         status="200") == 1
+    assert metrics.value("cloudprinting_sent_bytes_total",
+                         call="submit") > 0
+    assert metrics.value("cloudprinting_phase_duration_seconds",
+                         call="submit", phase="upload") == 1
+    assert 'cloudprinting_calls_total{call="deletejob",status="200"} 1' in \
+        metrics.render()
+
+
+@suite.test
+def account_pool_routes_calls():
+    with AccountPool(max_concurrency=2) as pool:
+        pool.add("a", client_id=environ['CP_CLIENT_ID'],
+                 client_secret=environ['CP_CLIENT_SECRET'],
+                 refresh_token=environ['CP_REFRESH_TOKEN'])
+        pool.add("b", auth=auth)
+        with raises(ValueError):
+            pool.add("b", auth=auth)
+        assert isinstance(pool.list_printers("a")['printers'], list)
+        assert isinstance(pool.list_jobs("b"), list)
+        assert pool["a"].client is not pool["b"].client
+        stats = pool.stats()
+        assert stats["a"]['calls'] == stats["b"]['calls'] == 1
+        assert stats["a"]['failures'] == 0
+        assert pool["a"].auth.expires_at is not None
+
+
+@suite.test
+def concurrent_listings_are_coalesced():
+    with MockCloudPrintServer(latency=0.2) as mock:
+        with CloudPrintClient(base_url=mock.url, coalesce=True) as client:
+            results = []
+            threads = [threading.Thread(
+                target=lambda: results.append(client.list_printers()))
+                for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert mock.requests['/search'] < 8
+            assert len(results) == 8
+            assert results[0] == results[1]
+            assert results[0]['printers'] is not results[1]['printers']
+            results[0]['printers'][0]['name'] = "changed"
+            assert results[1]['printers'][0]['name'] != "changed"
+
+            results = []
+            threads = [threading.Thread(
+                target=lambda: results.append(client.list_jobs(records=True)))
+                for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results[0] is not results[1]
+
+
+@suite.test
+def printer_directory_lookups():
+    directory = PrinterDirectory(auth=auth)
+    printer = directory.get(PRINTER_ID)
+    assert printer is not None
+    assert printer in directory.by_name(printer['name'])
+    assert printer in directory.find()
+    for duplex in (True, False):
+        for found in directory.find(duplex=duplex):
+            assert found['id'] in directory.index.by_capability[
+                ("duplex", duplex)]
+
+
+@suite.test
+def stale_printer_directory_is_refreshed_once():
+    with MockCloudPrintServer(latency=0.1) as mock:
+        with CloudPrintClient(base_url=mock.url) as client:
+            directory = PrinterDirectory(client, capabilities=False)
+            id = mock.printers[0]['id']
+            assert directory.get(id) is not None
+            directory.index.fetched_at = 0
+            results = []
+            threads = [threading.Thread(
+                target=lambda: results.append(directory.get(id)))
+                for i in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    assert len(results) == 10 and None not in results
+    assert mock.requests["/search"] == 2
+
+
+@suite.test
+def job_records_behave_like_dicts():
+    data = {"id": "abc", "status": "DONE", "createTime": "1343000000000",
+            "tags": ["a", "b"], "fileUrl": "http://example.com/file"}
+    job = Job(data)
+    assert job.create_time == 1343000000000
+    assert job.tags == ("a", "b")
+    assert job['createTime'] == "1343000000000"
+    assert job['fileUrl'] == data['fileUrl']
+    assert job.get('title') is None
+    assert 'fileUrl' in job and 'title' not in job
+    assert dict(job) == data
+    assert job == data
+    with raises(AttributeError):
+        job.colour = "red"
+    with raises(AttributeError):
+        job.status = "ERROR"
+
+
+@suite.test
+def listing_records():
+    printers = list_printers(records=True, auth=auth)['printers']
+    assert all(isinstance(printer, Printer) for printer in printers)
+    jobs = list_jobs(records=True, auth=auth)
+    assert all(isinstance(job, Job) for job in jobs)
+
+
+@suite.test
+def iterating_jobs_fetches_pages_lazily():
+    with MockCloudPrintServer() as mock:
+        printer = mock.printers[0]['id']
+        with CloudPrintClient(base_url=mock.url) as client:
+            ids = []
+            for i in range(5):
+                ids.insert(0, client.submit_job(printer, PDF)['job']['id'])
+                sleep(0.002)  # distinct creation times
+            jobs = client.iter_jobs(page_size=2)
+            assert [next(jobs)['id'] for i in range(2)] == ids[:2]
+            assert mock.requests["/jobs"] == 1
+
+            # a new job shifts the next page, which repeats the last job
+            client.submit_job(printer, PDF)
+            assert [job['id'] for job in jobs] == ids[2:]
+            assert mock.requests["/jobs"] == 4
+
+
+@suite.test
+def streamed_and_parsed_listings_agree():
+    threshold = client.STREAM_THRESHOLD
+    with MockCloudPrintServer() as mock:
+        printer = mock.printers[0]['id']
+        with CloudPrintClient(base_url=mock.url) as cp:
+            id = cp.submit_job(printer, PDF)['job']['id']
+            mock.jobs[id]['rating'] = 2.5
+            parsed = list(cp.iter_jobs())
+            client.STREAM_THRESHOLD = 0
+            try:
+                streamed = list(cp.iter_jobs())
+            finally:
+                client.STREAM_THRESHOLD = threshold
+    assert streamed == parsed
+    assert type(streamed[0]['rating']) is float
+
+
 @suite.test
 def print_pdf():
     job = submit_job(PRINTER_ID, PDF, auth=auth)['job']
@@ -54,6 +398,469 @@ def print_pdf():
         assert delete_job(job['id'], auth=auth)['success'] == True
 
 
+@suite.test
+def watching_a_job():
+    job = submit_job(PRINTER_ID, PDF, auth=auth)['job']
+    watcher = JobWatcher(min_interval=5, auth=auth)
+    try:
+        future = watcher.watch(job['id'], PRINTER_ID)
+        watcher.start()
+        assert future.result(timeout=30)['status'] == 'DONE'
+    finally:
+        watcher.stop()
+        assert delete_job(job['id'], auth=auth)['success'] == True
+
+
+@suite.test
+def job_watcher_callbacks():
+    with MockCloudPrintServer() as mock:
+        printer = mock.printers[0]['id']
+        with CloudPrintClient(base_url=mock.url) as cp:
+            id = cp.submit_job(printer, PDF)['job']['id']
+            watcher = JobWatcher(cp)
+            finished = []
+            watcher.watch(id, printer, callback=finished.append)
+            watcher.watch("unwatched", printer, callback=finished.append)
+            # failing callbacks are logged by concurrent.futures
+            errors = BufferingHandler(10)
+            logging.getLogger("concurrent.futures").addHandler(errors)
+            try:
+                watcher.unwatch("unwatched")
+            finally:
+                logging.getLogger("concurrent.futures").removeHandler(errors)
+            watcher.poll()
+    assert [job['id'] for job in finished] == [id]
+    assert errors.buffer == []
+
+
+@suite.test
+def job_watcher_survives_connection_errors():
+    mock = MockCloudPrintServer()
+    mock.start()
+    mock.stop()  # nothing listens at its address any more
+    with CloudPrintClient(base_url=mock.url) as client:
+        watcher = JobWatcher(client, min_interval=0.01, max_interval=0.1)
+        watcher.watch("job")
+        watcher.start()
+        try:
+            sleep(0.2)
+            assert watcher._thread.is_alive()
+            assert watcher.interval > watcher.min_interval
+        finally:
+            watcher.stop()
+
+
+@suite.test
+def job_change_feed_returns_changed_jobs():
+    with MockCloudPrintServer(processing_time=60) as mock:
+        printer = mock.printers[0]['id']
+        with CloudPrintClient(base_url=mock.url) as client:
+            for i in range(3):
+                client.submit_job(printer, PDF)
+            feed = JobChangeFeed(printer, client, page_size=2)
+            assert len(feed.poll()) == 3
+            assert feed.poll() == []
+
+            job = client.submit_job(printer, PDF)['job']
+            assert [changed['id'] for changed in feed.poll()] == [job['id']]
+
+            mock.processing_time = 0
+            changed = feed.poll()
+            assert len(changed) == 4
+            assert all(job['status'] == "DONE" for job in changed)
+            assert feed.poll() == []
+            # every job has finished, so only the newest page is fetched
+            fetched = mock.requests["/jobs"]
+            feed.poll()
+            assert mock.requests["/jobs"] == fetched + 1
+
+
+@suite.test
+def compressible_content_types():
+    for content_type in ("text/plain", "application/postscript",
+                         "text/html; charset=utf-8", "image/svg+xml"):
+        assert compressible(content_type)
+    for content_type in ("application/pdf", "image/jpeg", "url", None,
+                         "application/vnd.ms-xpsdocument",
+                         "application/octet-stream"):
+        assert not compressible(content_type)
+
+
+@suite.test
+def compressed_uploads_and_listings():
+    path = tempfile.mkdtemp()
+    try:
+        text = join(path, "report.txt")
+        with open(text, "w") as f:
+            f.write("All work and no play makes Jack a dull boy.\n" * 1000)
+        with MockCloudPrintServer() as mock:
+            printer = mock.printers[0]['id']
+            with CloudPrintClient(base_url=mock.url, compress=True) as client:
+                # uploads are only compressed when asked for
+                client.submit_job(printer, text)
+                assert client.compression_stats.sent == 0
+                assert mock.received > 44000
+
+            mock.received = 0
+            with CloudPrintClient(base_url=mock.url, compress=True,
+                                  compress_uploads=True) as client:
+                stats = client.compression_stats
+                job = client.submit_job(printer, text)['job']
+                assert mock.jobs[job['id']]['contentType'] == "text/plain"
+                assert stats.sent_raw > 44000
+                assert stats.sent < stats.sent_raw // 10
+                assert mock.received == stats.sent
+
+                # a PDF is uploaded as it is
+                client.submit_job(printer, PDF)
+                assert mock.received > stats.sent
+
+                for i in range(10):
+                    client.submit_job(printer, text)
+                assert len(client.list_jobs()) == 13
+                assert 0 < stats.received < stats.received_raw
+                assert stats.saved > 0
+    finally:
+        shutil.rmtree(path)
+
+
+@suite.test
+def multipart_encoder_streams_known_length():
+    encoder = MultipartEncoder([("title", "test"), ("tag", ["a", "b"])],
+                               "content", "test.pdf", BytesIO(b"x" * 10000),
+                               chunk_size=1024)
+    body = b""
+    while True:
+        chunk = encoder.read(4096)
+        if not chunk:
+            break
+        assert len(chunk) <= 4096
+        body += chunk
+    assert len(body) == encoder.len
+    assert body.count(b'name="tag"') == 2
+
+
+@suite.test
+def job_cache_evicts_least_recently_used():
+    cache = JobCache(ttl=60, maxsize=2)
+    cache.update([{"id": "a"}, {"id": "b"}], printer="p")
+    assert cache.listed("p")
+    assert not cache.listed("q")
+    assert cache.get("a") == {"id": "a"}
+    cache.add({"id": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"id": "a"}
+    assert len(cache) == 2
+
+    cache.ttl = 0
+    assert cache.get("a") is None
+    assert not cache.listed("p")
+
+
+@suite.test
+def cached_jobs_keep_the_requested_type():
+    with MockCloudPrintServer() as mock:
+        printer = mock.printers[0]['id']
+        with CloudPrintClient(base_url=mock.url,
+                              job_cache=JobCache()) as cp:
+            id = cp.submit_job(printer, PDF)['job']['id']
+            for listing in (cp.list_jobs, cp.iter_jobs):
+                assert all(isinstance(job, Job)
+                           for job in listing(records=True))
+                assert type(cp.get_job(id)) is dict
+                assert isinstance(cp.get_job(id, records=True), Job)
+
+
+@suite.test
+def document_cache_forgets_evicted_files():
+    path = tempfile.mkdtemp()
+    try:
+        documents = DocumentCache(max_bytes=300)
+        for i in range(10):
+            name = join(path, "%d.ps" % i)
+            with open(name, "wb") as f:
+                f.write(("%d" % i * 100).encode("ascii"))
+            documents.load(name)
+        assert len(documents._files) == 3
+
+        # a changed file replaces its previous version
+        for i in range(5):
+            content = ("%d" % i * 100).encode("ascii")
+            with open(name, "wb") as f:
+                f.write(content)
+            os.utime(name, (i, i))
+            assert documents.load(name).content == content
+        assert list(documents._files) == [name]
+    finally:
+        shutil.rmtree(path)
+
+
+@suite.test
+def document_cache_uploads_large_unpublished_documents():
+    path = tempfile.mkdtemp()
+    try:
+        published = join(path, "published.ps")
+        large = join(path, "large.ps")
+        with open(published, 'wb') as f:
+            f.write(b"%!PS published")
+        with open(large, 'wb') as f:
+            f.write(b"%!PS " + b"x" * 5000)
+        documents = DocumentCache(max_document_size=1000)
+        documents.publish(published, "http://example.com/published.ps")
+        assert documents.load(large) is None
+        with MockCloudPrintServer() as mock:
+            with CloudPrintClient(base_url=mock.url,
+                                  document_cache=documents) as client:
+                printer = mock.printers[0]['id']
+                assert client.submit_job(printer, large)['success']
+                assert mock.received > 5000
+                received = mock.received
+                assert client.submit_job(printer, published)['success']
+                assert mock.received - received < 1000
+                assert mock.jobs[client.list_jobs()[0]['id']] \
+                    ['contentType'] == "url"
+    finally:
+        shutil.rmtree(path)
+
+
+@suite.test
+def print_pdf_streaming():
+    job = submit_job(PRINTER_ID, PDF, streaming=True, auth=auth)['job']
+    try:
+        assert isinstance(job, dict)
+    finally:
+        assert delete_job(job['id'], auth=auth)['success'] == True
+
+
+@suite.test
+def spooled_jobs_are_submitted():
+    path = tempfile.mkdtemp()
+    try:
+        spooler = Spooler(path, auth=auth)
+        id = spooler.enqueue_job(PRINTER_ID, PDF)
+        assert spooler.status(id)['state'] == "queued"
+        assert spooler.drain() == 1
+        status = spooler.status(id)
+        assert status['state'] == "done"
+        assert spooler.pending() == 0
+        assert delete_job(status['job_id'], auth=auth)['success'] == True
+    finally:
+        shutil.rmtree(path)
+
+
+@suite.test
+def spooled_jobs_rejected_by_the_api_fail():
+    path = tempfile.mkdtemp()
+    try:
+        with MockCloudPrintServer() as mock:
+            with CloudPrintClient(base_url=mock.url) as client:
+                spooler = Spooler(path, client=client)
+                id = spooler.enqueue_job("no-such-printer", PDF)
+                assert spooler.drain() == 0
+        status = spooler.status(id)
+        assert status['state'] == "failed"
+        assert status['error'] == "Printer does not exist."
+        assert spooler.pending() == 0
+    finally:
+        shutil.rmtree(path)
+
+
+@suite.test
+def token_bucket_limits_rate():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.wait_time() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.wait_time() <= 0.2
+
+
+@suite.test
+def scheduler_takes_turns_between_tenants():
+    order = []
+
+    class Recorder(object):
+        def delete_job(self, id, **kwargs):
+            order.append(id)
+            return {"success": True}
+
+    limiter = RateLimiter(account_rate=None, printer_rate=100,
+                          printer_burst=1)
+    with Scheduler(client=Recorder(), limiter=limiter, workers=1) as s:
+        futures = [s.delete_job("a%d" % i, printer="p", tenant="a")
+                   for i in range(4)]
+        futures.append(s.delete_job("b0", printer="p", tenant="b"))
+    assert all(f.result()['success'] for f in futures)
+    assert order.index("b0") < order.index("a3")
+
+
+@suite.test
+def malformed_specs_fail_alone():
+    with MockCloudPrintServer() as mock:
+        with CloudPrintClient(base_url=mock.url) as client:
+            specs = [{"content": PDF},
+                     {"printer": mock.printers[0]['id'], "content": PDF}]
+            batch = client.submit_jobs(specs, per_printer_limit=1)
+            outcomes = list(batch)
+    assert len(outcomes) == 2
+    assert batch.failed == 1
+    failed = [outcome for outcome in outcomes if not outcome.ok][0]
+    assert isinstance(failed.error, KeyError)
+    assert len(mock.jobs) == 1
+
+
+@suite.test
+def deleting_jobs_in_parallel():
+    tag = "delete-jobs-test"
+    specs = [{"printer": PRINTER_ID, "content": PDF, "tags": [tag]}] * 3
+    batch = client.submit_jobs(specs, auth=auth)
+    assert all(outcome.ok for outcome in batch)
+    batch = delete_jobs(lambda job: tag in (job.get('tags') or ()),
+                        printer=PRINTER_ID, auth=auth)
+    assert len([outcome for outcome in batch if outcome.ok]) == 3
+    assert batch.failed == 0
+
+    select = job_filter(status="DONE", older_than=60)
+    assert select({"status": "DONE", "createTime": "1343000000000"})
+    assert not select({"status": "QUEUED", "createTime": "1343000000000"})
+    assert not select({"status": "DONE"})
+
+
+@suite.test
+def cli_context_keeps_recent_tokens():
+    context = Context()
+    context.max_auths = 2
+
+    def auth(token):
+        return context.auth(Namespace(access_token=token,
+                                      token_type="Bearer"))
+    first = auth("a")
+    auth("b")
+    assert auth("a") is first
+    auth("c")
+    assert auth("a") is first
+    assert list(context._auths) == [("c", "Bearer"), ("a", "Bearer")]
+
+
+@suite.test
+def cli_forwards_to_daemon():
+    path = tempfile.mkdtemp()
+    try:
+        socket = join(path, "cloudprinting.sock")
+        server = serve(socket, Context(auth=auth))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            out = StringIO()
+            assert forward(socket, ["list-printers", "--format", "jsonl"],
+                           out=out) == 0
+            printers = [json.loads(line) for line in
+                        out.getvalue().splitlines()]
+            assert PRINTER_ID in [printer['id'] for printer in printers]
+
+            manifest = StringIO('{"path": "%s", "printer": "%s"}\n'
+                                % (PDF, PRINTER_ID))
+            out = StringIO()
+            assert forward(socket, ["print-batch"], out=out,
+                           stdin=manifest) == 0
+            result = json.loads(out.getvalue())
+            assert result['ok'] and result['path'] == PDF
+            assert delete_job(result['job'], auth=auth)['success'] == True
+
+            # only the commands that may be forwarded are run
+            err = StringIO()
+            assert forward(socket, ["daemon"], err=err) == 2
+            assert "daemon" in err.getvalue()
+            assert forward(socket, ["oauth2", "--client-id", "foo",
+                                    "--client-secret", "bar", "authorise"],
+                           err=err) == 2
+
+            # a running daemon's socket isn't taken over
+            with raises(SystemExit):
+                serve(socket, Context(auth=auth))
+            assert forward(socket, ["list-printers"], out=StringIO()) == 0
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert forward(join(path, "missing.sock"), ["list-printers"]) is None
+
+        # the socket of a daemon that's no longer running is replaced
+        serve(socket, Context(auth=auth)).server_close()
+    finally:
+        shutil.rmtree(path)
+
+
+@suite.test
+def cli_record_formats():
+    records = [{"id": "a", "title": "x\ty"}, {"id": "b", "tags": ["t"]}]
+    outputs = {}
+    for format in ("json", "jsonl", "tsv"):
+        out = StringIO()
+        writer = RecordWriter(format, out, columns=("id", "title", "tags"))
+        for record in records:
+            writer.write(record)
+        writer.close()
+        outputs[format] = out.getvalue()
+    assert json.loads(outputs['json']) == records
+    assert [json.loads(line) for line in
+            outputs['jsonl'].splitlines()] == records
+    assert outputs['tsv'].splitlines() == ["id\ttitle\ttags",
+                                           "a\tx\\ty\t",
+                                           'b\t\t["t"]']
+
+
+@suite.test
+def transient_failures_are_retried():
+    policy = RetryPolicy(backoff=0.01, jitter=False)
+    with MockCloudPrintServer() as mock:
+        with CloudPrintClient(base_url=mock.url, retry=policy) as client:
+            mock.fail_next(2)
+            assert client.list_jobs() == []
+            assert mock.requests["/jobs"] == 3
+
+            # submitting without a dedupe key isn't safe to repeat
+            mock.fail_next(1)
+            r = client.submit_job(mock.printers[0]['id'], PDF)
+            assert r.status_code == 503
+            assert mock.jobs == {}
+
+            mock.fail_next(policy.max_attempts)
+            assert client.list_jobs().status_code == 503
+
+
+@suite.test
+def retries_wait_for_retry_after():
+    policy = RetryPolicy(backoff=0.01, jitter=False)
+    with MockCloudPrintServer(failure_status=429, retry_after=0.5) as mock:
+        with CloudPrintClient(base_url=mock.url, retry=policy) as client:
+            mock.fail_next(1)
+            started = time()
+            assert client.list_jobs() == []
+            assert time() - started >= 0.5
+            assert mock.requests["/jobs"] == 2
+
+
+@suite.test
+def retried_submissions_find_the_tagged_job():
+    policy = RetryPolicy(backoff=0.01, jitter=False)
+    with MockCloudPrintServer() as mock:
+        printer = mock.printers[0]['id']
+        with CloudPrintClient(base_url=mock.url, retry=policy) as client:
+            job = client.submit_job(printer, PDF, dedupe_key="once")['job']
+            # as if the response to a submission that succeeded was lost
+            mock.fail_next(1)
+            r = client.submit_job(printer, PDF, dedupe_key="once")
+            assert r['job']['id'] == job['id']
+            assert len(mock.jobs) == 1
+
+            mock.fail_next(1)
+            r = client.submit_job(printer, PDF, dedupe_key="twice")
+            assert r['success']
+            assert len(mock.jobs) == 2
+            assert mock.requests["/submit"] == 4
+
+
 @suite.test
 def response_is_returned_on_remote_failures():
     r = submit_job("bogus", PDF)